@@ -0,0 +1,187 @@
+# 給前端 JS 與外部程式用的 JSON API（/api/v1/...）
+# - 分頁用不透明的 cursor：回應的 next_cursor 原封不動帶回 ?cursor= 就是下一頁，
+#   內容是上一頁最後一筆的排序鍵，查詢用 (排序鍵) > (上一筆) 接著往下取，不必 OFFSET
+# - fields=課程名稱,群組 只查詢、只輸出需要的欄位
+# - 每一列直接由 db.DictCursor 建成 dict，有安裝 orjson 就用它輸出精簡的 JSON
+#
+#   GET /api/v1/courses?kind=資訊類&month=2025-08&fields=課程名稱,課程開始日期&limit=20
+#   GET /api/v1/news?cursor=<上一頁的 next_cursor>
+import base64
+import hashlib
+import json
+from datetime import date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from flask import Response, jsonify, request
+from psycopg2 import OperationalError
+
+import conditional
+import db
+import search
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+COURSE_FIELDS = ['群組', '課程類別', '課程名稱', '老師', '進修人數', '報名開始日期', '報名結束日期',
+                 '甄試資訊', '進修時數', '上課時間', '課程開始日期', '課程結束日期', '不上課日期',
+                 '課程內容', '進修費用', '報名資格', '就業方向', '筆試準備範圍']
+COURSE_DEFAULT_FIELDS = search.CARD_FIELDS
+# 排序鍵，也是匯入程式用的自然鍵，同一組值只會有一門課
+COURSE_KEYS = ['課程開始日期', '課程名稱']
+
+NEWS_FIELDS = ['id', '主題', '上版日期', '內容']
+NEWS_DEFAULT_FIELDS = ['id', '主題', '上版日期']
+NEWS_KEYS = ['上版日期', 'id']
+
+
+def encode_cursor(values):
+    text = json.dumps(values, ensure_ascii=False, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    # 格式不對一律當成無效的 cursor
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except ValueError:
+        raise ValueError("cursor 格式錯誤")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("cursor 格式錯誤")
+    return values
+
+
+def parse_fields(text, allowed, default):
+    if not text:
+        return list(default)
+    fields = []
+    for name in text.split(','):
+        name = name.strip()
+        if name not in allowed:
+            raise ValueError(f"不支援的欄位：{name}")
+        if name not in fields:
+            fields.append(name)
+    return fields
+
+
+def parse_limit(text):
+    try:
+        limit = int(text) if text else DEFAULT_LIMIT
+    except ValueError:
+        raise ValueError("limit 必須是數字")
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def json_response(payload, status=200):
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, ensure_ascii=False, default=str, separators=(',', ':')).encode('utf-8')
+    return Response(body, status=status, mimetype='application/json')
+
+
+def page_payload(rows, limit, keys, fields):
+    # rows 多查了一筆：有第 limit + 1 筆才表示還有下一頁
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor([rows[-1][key] for key in keys]) if has_more else None
+    # 為了產生 cursor 多查的排序鍵，不在 fields 裡就不輸出
+    extra = [key for key in keys if key not in fields]
+    if extra:
+        for row in rows:
+            for key in extra:
+                del row[key]
+    return {'data': rows, 'next_cursor': next_cursor}
+
+
+def _columns(fields, keys):
+    return ', '.join(f'"{name}"' for name in fields + [key for key in keys if key not in fields])
+
+
+def course_query(args):
+    # 篩選條件與 /classes/search 相同 (kind、group、month、fee、hours)
+    fields = parse_fields(args.get('fields'), COURSE_FIELDS, COURSE_DEFAULT_FIELDS)
+    limit = parse_limit(args.get('limit'))
+    where, params = search.where_clause(search.parse_filters(args))
+    conditions = [where, '"課程開始日期" IS NOT NULL AND "課程名稱" IS NOT NULL']
+    if args.get('cursor'):
+        params['after_date'], params['after_name'] = decode_cursor(args['cursor'], 2)
+        if not all(isinstance(value, str) for value in (params['after_date'], params['after_name'])):
+            raise ValueError("cursor 格式錯誤")
+        conditions.append('("課程開始日期", "課程名稱") > (%(after_date)s, %(after_name)s)')
+    params['limit'] = limit + 1
+    sql = f"""/* API_COURSES */
+    SELECT {_columns(fields, COURSE_KEYS)}
+    FROM "進修課程"
+    WHERE {' AND '.join(conditions)}
+    ORDER BY "課程開始日期", "課程名稱"
+    LIMIT %(limit)s;
+    """
+    return sql, params, fields, limit
+
+
+def news_query(args):
+    fields = parse_fields(args.get('fields'), NEWS_FIELDS, NEWS_DEFAULT_FIELDS)
+    limit = parse_limit(args.get('limit'))
+    params = {'limit': limit + 1}
+    condition = 'TRUE'
+    if args.get('cursor'):
+        after_date, after_id = decode_cursor(args['cursor'], 2)
+        if not isinstance(after_id, int) or not (after_date is None or isinstance(after_date, str)):
+            raise ValueError("cursor 格式錯誤")
+        params['after_id'] = after_id
+        params['after_date'] = date.fromisoformat(after_date) if after_date is not None else None
+        # 依 上版日期 DESC, id DESC 排序，沒有日期的訊息排在最前面
+        if params['after_date'] is None:
+            condition = '(上版日期 IS NULL AND id < %(after_id)s OR 上版日期 IS NOT NULL)'
+        else:
+            condition = '(上版日期, id) < (%(after_date)s, %(after_id)s)'
+    sql = f"""/* API_NEWS */
+    SELECT {_columns(fields, NEWS_KEYS)}
+    FROM public.最新訊息
+    WHERE {condition}
+    ORDER BY 上版日期 DESC, id DESC
+    LIMIT %(limit)s;
+    """
+    return sql, params, fields, limit
+
+
+def _list(table, build_query, keys):
+    try:
+        sql, params, fields, limit = build_query(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        with db.get_conn() as conn:
+            with conn.cursor() as cur:
+                version = conditional.table_version(cur, table)
+            if version is not None:
+                # 同一份資料版本、同一組參數的結果不會變
+                digest = hashlib.sha1(request.query_string).hexdigest()[:12]
+                etag, last_modified = conditional.validators(version, 'api', digest)
+                if conditional.is_not_modified(etag, last_modified):
+                    return conditional.not_modified_response(etag, last_modified)
+            with conn.cursor(cursor_factory=db.DictCursor) as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+    except OperationalError as e:
+        print("連線失敗")
+        print(e)
+        return jsonify(error="資料庫錯誤"), 500
+    response = json_response(page_payload(rows, limit, keys, fields))
+    if version is not None:
+        conditional.set_validators(response, etag, last_modified)
+    return response
+
+
+def init_app(app):
+    @app.route('/api/v1/courses')
+    def api_courses():
+        return _list('進修課程', course_query, COURSE_KEYS)
+
+    @app.route('/api/v1/news')
+    def api_news():
+        return _list('最新訊息', news_query, NEWS_KEYS)
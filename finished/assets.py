@@ -0,0 +1,108 @@
+# 雜湊檔名的靜態檔 (build_static.py 的輸出)：
+# - url_for('static', filename='css/base.css') 依 manifest 換成 /static/dist/css/base.<雜湊>.css
+# - 檔名隨內容改變，所以可以讓瀏覽器快取一年且不必回來驗證 (immutable)，重複造訪不會再送出靜態檔請求
+# - 依 Accept-Encoding 送出預先壓好的 .br 或 .gz
+# - 模板用 picture('images/banner1.png', ...) 輸出 AVIF / WebP 的 <picture> 與 srcset，並帶寬高避免版面跳動
+# 沒有執行過 build_static.py（開發環境）時沒有 manifest，一切維持 Flask 預設的行為
+import json
+import mimetypes
+import os
+
+from flask import abort, request, send_from_directory, url_for
+from markupsafe import Markup
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# 優先順序：brotli 比 gzip 小
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+manifest = load_manifest()
+# 雜湊檔名 -> 有哪些預先壓縮的版本；響應式圖片只有原檔
+encodings = {item['file']: item['encodings'] for item in manifest.values()}
+for item in manifest.values():
+    for files in item.get('variants', {}).values():
+        encodings.update((path, []) for _, path in files)
+
+
+def hashed_url_defaults(endpoint, values):
+    # 掛在 app.url_defaults：產生 static 網址時把檔名換成 dist/ 裡的雜湊檔名
+    if endpoint == 'static' and manifest:
+        filename = values.get('filename')
+        item = manifest.get(filename.lstrip('/')) if filename else None
+        if item is not None:
+            values['filename'] = 'dist/' + item['file']
+
+
+def pick_variant(filename, accept_encodings):
+    # 回傳 (實際要送的檔名, Content-Encoding)；用戶端不接受壓縮時送原檔
+    for encoding in ENCODING_SUFFIXES:
+        if encoding in encodings.get(filename, ()) and accept_encodings[encoding]:
+            return filename + ENCODING_SUFFIXES[encoding], encoding
+    return filename, None
+
+
+def finish_response(response, filename, encoding):
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def picture_helper(url_for):
+    # url_for 由呼叫端傳入，同一個 helper 給 Flask 與 Quart 用
+    def picture(filename, alt, sizes='100vw', lazy=True, css_class=None):
+        # lazy=False 給首屏的主圖 (LCP)：不延遲載入並提高下載優先順序
+        item = manifest.get(filename)
+        attrs = {'src': url_for('static', filename=filename), 'alt': alt, 'class': css_class}
+        if item is not None and 'width' in item:
+            attrs.update(width=item['width'], height=item['height'])
+        if lazy:
+            attrs.update(loading='lazy', decoding='async')
+        else:
+            attrs['fetchpriority'] = 'high'
+        img = Markup('<img{}>').format(_attributes(attrs))
+        variants = item.get('variants') if item is not None else None
+        if not variants:
+            return img
+
+        sources = []
+        for ext, files in variants.items():
+            srcset = ', '.join(f"{url_for('static', filename='dist/' + path)} {width}w"
+                               for width, path in files)
+            sources.append(Markup('<source{}>').format(
+                _attributes({'type': f'image/{ext}', 'srcset': srcset, 'sizes': sizes})))
+        return Markup('<picture>{}{}</picture>').format(Markup('').join(sources), img)
+    return picture
+
+
+def _attributes(attrs):
+    return Markup('').join(Markup(' {}="{}"').format(name, value)
+                           for name, value in attrs.items() if value is not None)
+
+
+def init_app(app):
+    app.url_defaults(hashed_url_defaults)
+    app.jinja_env.globals['picture'] = picture_helper(url_for)
+
+    # 比 Flask 的 /static/<path:filename> 多一段固定路徑，會優先比對
+    @app.route('/static/dist/<path:filename>')
+    def hashed_static(filename):
+        if filename not in encodings:
+            abort(404)
+        path, encoding = pick_variant(filename, request.accept_encodings)
+        response = send_from_directory(DIST_DIR, path,
+                                       mimetype=mimetypes.guess_type(filename)[0])
+        return finish_response(response, filename, encoding)
@@ -0,0 +1,414 @@
+# index.py 的非同步版本：Quart + psycopg 3 的 AsyncConnectionPool
+# 路由、SQL (queries.py) 與模板都和同步版相同，差別在等待資料庫時不會卡住 worker，
+# 一個 worker 可以同時處理很多個正在查詢的請求
+#
+# 啟動：uvicorn async_index:app --workers 1
+# 比較：python -m bench.compare_async --sync http://127.0.0.1:8000 --async http://127.0.0.1:8001
+import mimetypes
+import os
+from contextlib import asynccontextmanager
+
+from markupsafe import Markup
+from psycopg import OperationalError, errors
+from psycopg_pool import AsyncConnectionPool, PoolTimeout, TooManyRequests
+from quart import (Quart, abort, jsonify, make_response, render_template, request, send_from_directory,
+                   stream_template, url_for)
+
+import assets
+import compression
+import conditional
+import db  # 載入 .env 並取得 conn_string
+import fulltext
+import queries
+import search
+import warmup
+from cache import LRUCache, TTLCache
+
+app = Quart(__name__)
+app.url_defaults(assets.hashed_url_defaults)
+app.jinja_env.globals['picture'] = assets.picture_helper(url_for)
+warmup.init_app(app)
+
+# 非同步版一條連線同一時間只跑一個查詢，要重疊多個查詢就需要比較大的池
+pool = AsyncConnectionPool(db.conn_string,
+                           min_size=int(os.getenv('ASYNC_DB_POOL_MIN', '2')),
+                           max_size=int(os.getenv('ASYNC_DB_POOL_MAX', '20')),
+                           timeout=db.POOL_TIMEOUT,
+                           max_waiting=int(os.getenv('ASYNC_DB_POOL_MAX_WAITING', '100')),
+                           # psycopg 3 內建預備陳述式：同一個查詢在一條連線上執行超過 prepare_threshold 次就改用
+                           # 伺服器端的預備陳述式，設成 0 表示第一次就預備；數字參數也會以二進位格式傳送
+                           kwargs={**db.CONNECT_OPTIONS,
+                                   'prepare_threshold': int(os.getenv('ASYNC_DB_PREPARE_THRESHOLD', '0'))},
+                           check=AsyncConnectionPool.check_connection,
+                           open=False)
+
+# 與同步版相同的快取；非同步版沒有 LISTEN 執行緒，key 都帶 進修課程 的資料版本號，版本一變就重新查詢
+# TTL 只用來清掉舊版本留下的項目（沒有資料版本表時也靠它更新）
+kinds_cache = TTLCache(ttl=float(os.getenv('COURSE_KINDS_TTL', '600')))
+cards_cache = LRUCache(max_bytes=int(os.getenv('CARDS_CACHE_BYTES', str(4 * 1024 * 1024))))
+
+
+@app.after_request
+async def compress_response(response):
+    if compression.should_compress(response):
+        compression.apply(response, await response.get_data(), request.accept_encodings)
+    return response
+
+
+@asynccontextmanager
+async def db_connection():
+    # 與 db.get_conn() 相同的斷路器；連線池的逾時與排隊已滿轉成 db 的例外，由 database_unavailable 回 503
+    retry_after = db.breaker.allow()
+    if retry_after is not None:
+        raise db.CircuitOpen("資料庫暫時無法使用", retry_after)
+    outcome = db.breaker.success
+    try:
+        async with pool.connection() as conn:
+            yield conn
+    except TooManyRequests as e:
+        outcome = db.breaker.cancel
+        raise db.QueueFull(str(e)) from e
+    except PoolTimeout as e:
+        outcome = db.breaker.failure
+        raise db.PoolTimeout(str(e)) from e
+    except OperationalError:
+        outcome = db.breaker.failure
+        raise
+    finally:
+        outcome()
+
+
+@app.errorhandler(db.Unavailable)
+async def database_unavailable(e):
+    if request.endpoint == 'new_content' or request.args.get('format') == 'json':
+        response = jsonify(error="系統忙碌中，請稍後再試")
+    else:
+        response = await make_response(await render_template("error.html.jinja2",
+                                                             error_message="系統忙碌中，請稍後再試"))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    response.cache_control.no_store = True
+    return response
+
+
+@app.errorhandler(errors.UndefinedTable)
+async def schema_missing(e):
+    # 和同步版相同：還沒套用 finished/sql 的設定檔時給明確的錯誤頁
+    print("資料表或檢視不存在，請執行 finished/sql 的設定檔")
+    print(e)
+    if request.endpoint == 'new_content' or request.args.get('format') == 'json':
+        return jsonify(error="網站資料尚未建立完成"), 500
+    return await render_template("error.html.jinja2", error_message="網站資料尚未建立完成，請稍後再試"), 500
+
+
+@app.before_serving
+async def open_pool():
+    # 等最少的連線數都建立好、模板都編譯好才開始接受請求 (warmup.py)
+    await pool.open(wait=True)
+    if warmup.ENABLED:
+        warmup.compile_templates(app)
+
+
+@app.after_serving
+async def close_pool():
+    await pool.close()
+
+
+async def table_version(cur, table):
+    # 和 conditional.table_version 相同：還沒套用 sql/異動通知.sql 時回傳 None，不產生 ETag
+    try:
+        await cur.execute(queries.TABLE_VERSION, (table,))
+    except errors.UndefinedTable:
+        await cur.connection.rollback()
+        return None
+    return await cur.fetchone()
+
+
+async def not_modified_response(etag, last_modified):
+    return conditional.set_validators(await make_response('', 304), etag, last_modified)
+
+
+async def load_kinds(cur, version):
+    # version 是 table_version(cur, '進修課程') 的結果，和同步版 index.cached_kinds 一樣以版本號為 key
+    key = ('kinds', version[0] if version is not None else None)
+    kinds = kinds_cache.peek(key)
+    if kinds is None:
+        await cur.execute(queries.COURSE_KINDS)
+        kinds = [kind[0] for kind in await cur.fetchall()]
+        kinds.reverse()
+        kinds_cache.put(key, kinds)
+    return kinds
+
+
+async def load_course_page(cur, kind, page, per_page):
+    await cur.execute(queries.COURSE_PAGE, (kind, (page - 1) * per_page, per_page))
+    rows = await cur.fetchall()
+    if rows:
+        total = rows[0][-1]
+    else:
+        await cur.execute(queries.COURSE_COUNT, (kind,))
+        total = (await cur.fetchone())[0]
+    items = [row[:-1] for row in rows]
+    return items, queries.total_pages(total, per_page)
+
+
+@app.route("/")
+async def index():
+    return await render_template("index.html.jinja2")
+
+
+@app.route("/classes")
+async def classes():
+    course_types = request.args.get('kind', '一般課程', type=str)
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        page = 1
+    page = min(page, queries.PAGE_MAX)
+    per_page = 6
+    try:
+        async with db_connection() as conn, conn.cursor() as cur:
+            version = await table_version(cur, '進修課程')
+            if version is not None:
+                etag, last_modified = conditional.validators(version)
+                if conditional.is_not_modified(etag, last_modified, request):
+                    return await not_modified_response(etag, last_modified)
+
+            kinds = await load_kinds(cur, version)
+
+            cache_key = (course_types, page, version[0]) if version is not None else None
+            course_cards = cards_cache.get(cache_key) if cache_key is not None else None
+            if course_cards is None:
+                items, total_pages = await load_course_page(cur, course_types, page, per_page)
+    except OperationalError as e:
+        print("連線失敗")
+        print(e)
+        return await render_template("error.html.jinja2", error_message="資料庫錯誤"), 500
+
+    if course_cards is None:
+        course_cards = Markup(await render_template("partials/course_cards.html.jinja2",
+                                                    course_data=items,
+                                                    page=page,
+                                                    total_pages=total_pages,
+                                                    current_kind=course_types))
+        if cache_key is not None:
+            cards_cache.put(cache_key, course_cards)
+
+    response = await make_response(await render_template("classes.html.jinja2",
+                                                         kinds=kinds,
+                                                         course_cards=course_cards,
+                                                         current_kind=course_types))
+    if version is not None:
+        conditional.set_validators(response, etag, last_modified)
+    return response
+
+
+@app.route("/classes/search")
+async def classes_search():
+    filters = search.parse_filters(request.args)
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        page = 1
+    page = min(page, queries.PAGE_MAX)
+    per_page = 6
+    try:
+        async with db_connection() as conn, conn.cursor() as cur:
+            sql, params = search.facet_query(filters, page, per_page)
+            await cur.execute(sql, params)
+            result = search.facet_result(await cur.fetchone(), filters, page, per_page)
+            kinds = await load_kinds(cur, await table_version(cur, '進修課程'))
+    except OperationalError as e:
+        print("連線失敗")
+        print(e)
+        if request.args.get('format') == 'json':
+            return jsonify(error="資料庫錯誤"), 500
+        return await render_template("error.html.jinja2", error_message="資料庫錯誤"), 500
+
+    if request.args.get('format') == 'json':
+        return jsonify(result)
+
+    course_data = [[course[name] for name in search.CARD_FIELDS] for course in result['results']]
+    return await render_template("classes_search.html.jinja2",
+                                 kinds=kinds,
+                                 course_data=course_data,
+                                 facets=result['facets'],
+                                 filters=filters,
+                                 total=result['total'],
+                                 page=page,
+                                 total_pages=result['total_pages'],
+                                 facet_params=search.FACET_PARAMS,
+                                 toggle=search.toggle,
+                                 pagination_endpoint='classes_search',
+                                 pagination_args=filters)
+
+
+@app.route("/search")
+async def site_search():
+    q = request.args.get('q', '', type=str).strip()
+    section = request.args.get('type', '', type=str)
+    if section not in ('course', 'news'):
+        section = ''
+    page = request.args.get('page', 1, type=int)
+    if page < 1 or not section:
+        page = 1
+    page = min(page, queries.PAGE_MAX)
+    per_page = 10 if section else 5
+
+    terms = fulltext.query_terms(q)
+    results = {}
+    if terms:
+        tsquery = fulltext.to_tsquery(terms)
+        try:
+            async with db_connection() as conn, conn.cursor() as cur:
+                for name, sql in (('course', queries.COURSE_SEARCH), ('news', queries.NEWS_SEARCH)):
+                    if section in ('', name):
+                        await cur.execute(sql, (tsquery, per_page, (page - 1) * per_page))
+                        rows = await cur.fetchall()
+                        total = rows[0][-1] if rows else 0
+                        results[name] = {'rows': [row[:-1] for row in rows],
+                                         'total': total,
+                                         'total_pages': queries.total_pages(total, per_page)}
+        except OperationalError as e:
+            print("連線失敗")
+            print(e)
+            return await render_template("error.html.jinja2", error_message="資料庫錯誤"), 500
+
+    return await render_template("search.html.jinja2",
+                                 q=q,
+                                 terms=terms,
+                                 section=section,
+                                 page=page,
+                                 results=results,
+                                 highlight=fulltext.highlight)
+
+
+NEWS_STREAM_BATCH = int(os.getenv('NEWS_STREAM_BATCH', '200'))
+
+
+async def news_stream(limit, offset):
+    # 與同步版相同：server-side cursor 逐批讀取，連線在整頁送完後才歸還
+    async with db_connection() as conn, conn.cursor(name='news_stream') as cur:
+        cur.itersize = NEWS_STREAM_BATCH
+        await cur.execute(queries.NEWS_LIST, (limit, offset))
+        yield
+        async for row in cur:
+            yield row
+
+
+async def open_news_stream(limit, offset):
+    # 先借連線並送出查詢，連不上時還來得及回錯誤頁
+    rows = news_stream(limit, offset)
+    await rows.__anext__()
+    return log_stream_errors(rows)
+
+
+async def log_stream_errors(rows):
+    try:
+        async for row in rows:
+            yield row
+    except OperationalError as e:
+        # 標頭已經送出，只能記錄後結束列表；回應是 no-store，不完整的頁面不會被快取
+        print("連線失敗")
+        print(e)
+
+
+@app.route("/new")
+async def new():
+    show_all = request.args.get('all') == '1'
+    page = request.args.get('page', 1, type=int)
+    if page < 1 or show_all:
+        page = 1
+    per_page = 10
+    try:
+        async with db_connection() as conn, conn.cursor() as cur:
+            version = await table_version(cur, '最新訊息')
+            # 串流的回應不帶 ETag：送到一半中斷的頁面不能之後再被 304 確認
+            if version is not None and not show_all:
+                etag, last_modified = conditional.validators(version)
+                if conditional.is_not_modified(etag, last_modified, request):
+                    return await not_modified_response(etag, last_modified)
+
+            await cur.execute(queries.NEWS_COUNT)
+            total = (await cur.fetchone())[0]
+            total_pages = queries.total_pages(total, per_page)
+            page = min(page, total_pages)
+            if not show_all:
+                await cur.execute(queries.NEWS_LIST, (per_page, (page - 1) * per_page))
+                rows = await cur.fetchall()
+        if show_all:
+            rows = await open_news_stream(None, 0)
+    except OperationalError as e:
+        print("連線失敗")
+        print(e)
+        return await render_template("error.html.jinja2", error_message="資料庫錯誤"), 500
+
+    context = dict(page=page,
+                   per_page=per_page,
+                   total=total,
+                   show_all=show_all,
+                   total_pages=total_pages)
+    if show_all:
+        response = await make_response(await stream_template("new.html.jinja2", rows=rows, **context))
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.cache_control.no_store = True
+    else:
+        # 一頁只有幾筆，直接整頁渲染（也能被壓縮）
+        response = await make_response(await render_template("new.html.jinja2", rows=rows, **context))
+        if version is not None:
+            conditional.set_validators(response, etag, last_modified)
+    return response
+
+
+@app.route("/new/<int:news_id>")
+async def new_content(news_id):
+    # id 是 smallint，超出範圍的不必查詢
+    if news_id > queries.NEWS_ID_MAX:
+        return jsonify(error="找不到這則訊息"), 404
+    try:
+        async with db_connection() as conn, conn.cursor() as cur:
+            version = await table_version(cur, '最新訊息')
+            if version is not None:
+                etag, last_modified = conditional.validators(version, news_id)
+                if conditional.is_not_modified(etag, last_modified, request):
+                    return await not_modified_response(etag, last_modified)
+
+            await cur.execute(queries.NEWS_CONTENT, (news_id,))
+            row = await cur.fetchone()
+    except OperationalError as e:
+        print("連線失敗")
+        print(e)
+        return jsonify(error="資料庫錯誤"), 500
+    if row is None:
+        return jsonify(error="找不到這則訊息"), 404
+
+    response = jsonify(id=row[0], 內容=row[1])
+    if version is not None:
+        conditional.set_validators(response, etag, last_modified)
+    return response
+
+
+@app.route("/traffic")
+async def traffic():
+    return await render_template("traffic.html.jinja2")
+
+
+@app.route("/contact")
+async def contact():
+    return await render_template("contact.html.jinja2")
+
+
+@app.route("/static/dist/<path:filename>")
+async def hashed_static(filename):
+    if filename not in assets.encodings:
+        abort(404)
+    path, encoding = assets.pick_variant(filename, request.accept_encodings)
+    response = await send_from_directory(assets.DIST_DIR, path,
+                                         mimetype=mimetypes.guess_type(filename)[0])
+    return assets.finish_response(response, filename, encoding)
+
+
+@app.route("/pool_stats")
+async def pool_stats():
+    return jsonify(pool=pool.get_stats(),
+                   breaker=db.breaker.stats(),
+                   kinds_cache=kinds_cache.stats(),
+                   cards_cache=cards_cache.stats())
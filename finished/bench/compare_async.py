@@ -0,0 +1,41 @@
+# 同步版 (index.py / gunicorn) 與非同步版 (async_index.py / uvicorn) 的吞吐量比較
+# 兩個伺服器要先各自啟動，指向同一個資料庫，例如：
+#   gunicorn -w 1 -b 127.0.0.1:8000 index:app
+#   uvicorn --workers 1 --port 8001 async_index:app
+#   python -m bench.compare_async --sync http://127.0.0.1:8000 --async http://127.0.0.1:8001
+import argparse
+from urllib.parse import quote
+
+from bench import load
+
+DEFAULT_PATHS = [
+    '/classes',
+    '/classes?kind=' + quote('一般課程') + '&page=2',
+    '/new',
+    '/new?page=2',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較同步與非同步版網站的吞吐量")
+    parser.add_argument('--sync', dest='sync_url', default='http://127.0.0.1:8000')
+    parser.add_argument('--async', dest='async_url', default='http://127.0.0.1:8001')
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-d', '--duration', type=float, default=15.0)
+    parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS)
+    args = parser.parse_args()
+
+    results = {}
+    for name, url in (('sync', args.sync_url), ('async', args.async_url)):
+        results[name] = load.run(url, args.paths, args.concurrency, args.duration)
+        load.print_report(f"{name} {url} (concurrency={args.concurrency})", results[name])
+        print()
+
+    sync_rps = results['sync']['*']['rps']
+    async_rps = results['async']['*']['rps']
+    if sync_rps:
+        print(f"async / sync 吞吐量比: {async_rps / sync_rps:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
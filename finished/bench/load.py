@@ -0,0 +1,94 @@
+# 簡單的壓力測試工具：多個執行緒各自用 keep-alive 連線重複送出請求
+# 只用標準函式庫，CI 上不需要另外安裝 wrk / locust
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, queries=()):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'rps': round(count / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        # 伺服器有開 DB_QUERY_HEADER=1 時才有資料
+        'db_queries': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def run(base_url, paths, concurrency=10, duration=10.0, headers=None):
+    # paths 會依序輪流送出；回傳 {路徑: 統計} 與整體統計
+    parts = urlsplit(base_url)
+    per_path = {path: [] for path in paths}
+    errors = {path: 0 for path in paths}
+    queries = {path: [] for path in paths}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(offset):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        local = {path: [] for path in paths}
+        local_errors = {path: 0 for path in paths}
+        local_queries = {path: [] for path in paths}
+        i = offset
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers or {})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 500
+                counted = response.getheader('X-DB-Queries')
+                if counted is not None:
+                    local_queries[path].append(int(counted))
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            if ok:
+                local[path].append(time.perf_counter() - start)
+            else:
+                local_errors[path] += 1
+        conn.close()
+        with lock:
+            for path in paths:
+                per_path[path].extend(local[path])
+                errors[path] += local_errors[path]
+                queries[path].extend(local_queries[path])
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    report = {path: summarize(per_path[path], errors[path], elapsed, queries[path]) for path in paths}
+    everything = [latency for path in paths for latency in per_path[path]]
+    all_queries = [n for path in paths for n in queries[path]]
+    report['*'] = summarize(everything, sum(errors.values()), elapsed, all_queries)
+    return report
+
+
+def print_report(title, report):
+    print(f"== {title}")
+    print(f"{'route':40} {'req':>7} {'err':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'db q':>6}")
+    for path, s in report.items():
+        db_queries = '-' if s['db_queries'] is None else s['db_queries']
+        print(f"{path:40} {s['requests']:>7} {s['errors']:>5} {s['rps']:>8} "
+              f"{s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {db_queries:>6}")
@@ -0,0 +1,130 @@
+# 比較預備陳述式 (queries.PREPARED) 與每次送出完整 SQL 的差別
+# 1. 每個查詢各跑 N 次：平均延遲，以及 EXPLAIN ANALYZE 回報的規劃時間 (Planning Time)
+# 2. --routes：在行程內啟動 index.app，關掉快取，DB_PREPARE 關/開各跑一次 /classes 與 /new
+#
+#   python -m bench.prepared --database postgresql://localhost/course_bench -n 2000
+#   python -m bench.prepared --database ... --routes -c 8 -d 10
+import argparse
+import json
+import os
+import statistics
+import time
+
+import psycopg2
+
+from bench import load
+from bench.run import build_paths, start_local_server
+import queries
+
+
+def sample_params(cur):
+    # 用測試資料裡實際存在的值當參數
+    cur.execute('SELECT "課程類別" FROM "課程卡片" GROUP BY 1 ORDER BY count(*) DESC LIMIT 1;')
+    kind = cur.fetchone()[0]
+    cur.execute('SELECT min(id) FROM public.最新訊息;')
+    news_id = cur.fetchone()[0]
+    return {
+        'TABLE_VERSION': ('進修課程',),
+        'COURSE_KINDS': (),
+        'COURSE_PAGE': (kind, 0, 6),
+        'COURSE_COUNT': (kind,),
+        'NEWS_COUNT': (),
+        'NEWS_LIST': (10, 0),
+        'NEWS_CONTENT': (news_id,),
+    }
+
+
+def timed(cur, sql, params, iterations):
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        times.append(time.perf_counter() - start)
+    return statistics.mean(times) * 1000
+
+
+def planning_ms(cur, sql, params):
+    cur.execute('EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) ' + sql, params)
+    return cur.fetchone()[0][0]['Planning Time']
+
+
+def bench_queries(dsn, iterations):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    results = {}
+    try:
+        with conn.cursor() as cur:
+            params = sample_params(cur)
+            for name in queries.PREPARED:
+                sql = getattr(queries, name)
+                plain = timed(cur, sql, params[name], iterations)
+                plain_plan = planning_ms(cur, sql, params[name])
+
+                cur.execute(queries.prepare_sql(name))
+                execute = queries.execute_sql(name)
+                prepared = timed(cur, execute, params[name], iterations)
+                # 執行過幾次之後 PostgreSQL 會改用快取的通用計畫，這時的規劃時間才有代表性
+                prepared_plan = planning_ms(cur, execute, params[name])
+                cur.execute(f'DEALLOCATE {name.lower()};')
+
+                results[name] = {'plain_ms': round(plain, 3), 'prepared_ms': round(prepared, 3),
+                                 'plain_plan_ms': round(plain_plan, 3),
+                                 'prepared_plan_ms': round(prepared_plan, 3)}
+    finally:
+        conn.close()
+    return results
+
+
+def bench_routes(dsn, args):
+    # 關掉路由的資料快取與卡片快取，每個請求都要查資料庫，才看得出查詢本身的差別
+    os.environ['SWR_MAX_ENTRIES'] = '0'
+    os.environ['CARDS_CACHE_BYTES'] = '0'
+    paths = [path for path in build_paths(dsn)
+             if path.startswith('/classes?') or path.startswith('/new') and 'all=1' not in path]
+    server, url = start_local_server(dsn)
+    import db
+    reports = {}
+    try:
+        for enabled in (False, True):
+            db.PREPARE_ENABLED = enabled
+            load.run(url, paths, concurrency=1, duration=min(1.0, args.duration))
+            reports['prepared' if enabled else 'plain'] = load.run(url, paths, args.concurrency, args.duration)
+    finally:
+        server.shutdown()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較預備陳述式與一般查詢")
+    parser.add_argument('--database', default=os.getenv('BENCH_DATABASE'),
+                        help="測試資料庫連線字串 (預設讀 BENCH_DATABASE)")
+    parser.add_argument('-n', '--iterations', type=int, default=1000, help="每個查詢執行的次數")
+    parser.add_argument('--routes', action='store_true', help="另外比較 /classes 與 /new 的延遲")
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-d', '--duration', type=float, default=10.0)
+    parser.add_argument('--json', dest='json_out', help="把結果寫成 JSON")
+    args = parser.parse_args()
+    if not args.database:
+        parser.error("請用 --database 或 BENCH_DATABASE 指定測試資料庫")
+
+    results = {'queries': bench_queries(args.database, args.iterations)}
+    print(f"每個查詢執行 {args.iterations} 次的平均延遲與規劃時間 (毫秒)")
+    print(f"{'query':14} {'plain':>8} {'prepared':>9} {'plan':>8} {'plan(prep)':>11}")
+    for name, r in results['queries'].items():
+        print(f"{name:14} {r['plain_ms']:>8} {r['prepared_ms']:>9} "
+              f"{r['plain_plan_ms']:>8} {r['prepared_plan_ms']:>11}")
+
+    if args.routes:
+        results['routes'] = bench_routes(args.database, args)
+        for label, report in results['routes'].items():
+            print()
+            load.print_report(f"{label} (concurrency={args.concurrency}, duration={args.duration}s)", report)
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
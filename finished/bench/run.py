@@ -0,0 +1,140 @@
+# 路由壓力測試：對 /classes?kind=...&page=...、/new 與 /search 送出並行請求，
+# 報告每個路由的 p50/p95/p99 延遲、吞吐量與每個請求的資料庫查詢數
+#
+#   python -m bench.run --database postgresql://localhost/course_bench --scale 200 -c 16 -d 20
+#   python -m bench.run --database ... --json result.json --baseline baseline.json
+#
+# 沒有指定 --url 時，會在這個行程裡用 werkzeug 啟動 index.app，不需要網路或外部服務；
+# CI 只要準備一個本機 PostgreSQL（例如 service container）就能跑
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+from urllib.parse import urlencode
+
+import psycopg2
+
+from bench import load, seed
+
+
+def build_paths(dsn, per_page=6, news_per_page=10):
+    # 每個課程類別測第一頁、中間頁與最後一頁，最新訊息測前兩頁與一則內容
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT "課程類別", count(*) FROM "進修課程" GROUP BY 1 ORDER BY 1;')
+            kinds = cur.fetchall()
+            cur.execute('SELECT count(*), min(id) FROM public.最新訊息;')
+            news_total, first_id = cur.fetchone()
+    finally:
+        conn.close()
+
+    paths = []
+    for kind, count in kinds:
+        last = max(1, (count + per_page - 1) // per_page)
+        for page in sorted({1, (last + 1) // 2, last}):
+            paths.append('/classes?' + urlencode({'kind': kind, 'page': page}))
+    paths.append('/new')
+    if news_total > news_per_page:
+        paths.append('/new?page=2')
+        # 全部訊息：串流輸出，查詢在送出回應的過程中執行，不會算進 X-DB-Queries
+        paths.append('/new?all=1')
+    if first_id is not None:
+        paths.append(f'/new/{first_id}')
+    # 全文檢索：常見的詞與只在少數課程出現的詞
+    for q in ('課程', 'Python 資料分析'):
+        paths.append('/search?' + urlencode({'q': q}))
+    # JSON API：預設欄位與只取兩個欄位
+    for kind, _ in kinds[:1]:
+        paths.append('/api/v1/courses?' + urlencode({'kind': kind}))
+        paths.append('/api/v1/courses?' + urlencode({'kind': kind, 'fields': '課程名稱,課程開始日期', 'limit': 100}))
+    paths.append('/api/v1/news')
+    return paths
+
+
+def start_local_server(dsn):
+    # 匯入 index 之前先設定環境變數，讓連線池連到測試資料庫並回報查詢數
+    os.environ['RENDER_DATABASE'] = dsn
+    os.environ['DB_QUERY_HEADER'] = '1'
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    index = importlib.import_module('index')
+
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, index.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def compare(report, baseline, tolerance):
+    # p95 變慢超過容許比例，或每個請求的查詢數變多，都算退步
+    problems = []
+    for path, stats in report.items():
+        old = baseline.get(path)
+        if old is None:
+            continue
+        if old['p95_ms'] and stats['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            problems.append(f"{path}: p95 {old['p95_ms']} -> {stats['p95_ms']} ms")
+        if old.get('db_queries') is not None and stats['db_queries'] is not None \
+                and stats['db_queries'] > old['db_queries']:
+            problems.append(f"{path}: 查詢數 {old['db_queries']} -> {stats['db_queries']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="課程網站路由壓力測試")
+    parser.add_argument('--database', default=os.getenv('BENCH_DATABASE'),
+                        help="測試資料庫連線字串 (預設讀 BENCH_DATABASE)")
+    parser.add_argument('--scale', type=int, default=0,
+                        help="大於 0 時先用 bench.seed 依這個倍數重建測試資料")
+    parser.add_argument('--url', help="改測已經在跑的伺服器，例如 gunicorn；不指定就在行程內啟動")
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-d', '--duration', type=float, default=10.0)
+    parser.add_argument('--json', dest='json_out', help="把結果寫成 JSON，可當之後的 baseline")
+    parser.add_argument('--baseline', help="和先前的 JSON 結果比較，退步時以狀態碼 1 結束")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="p95 允許變慢的比例 (預設 0.25)")
+    args = parser.parse_args()
+    if not args.database:
+        parser.error("請用 --database 或 BENCH_DATABASE 指定測試資料庫")
+
+    if args.scale > 0:
+        courses, news = seed.seed(args.database, args.scale)
+        print(f"已建立測試資料：進修課程 {courses} 筆，最新訊息 {news} 筆")
+
+    paths = build_paths(args.database)
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_local_server(args.database)
+
+    try:
+        # 先每個路徑打一次，避免把模板編譯與建立連線算進結果
+        load.run(url, paths, concurrency=1, duration=min(1.0, args.duration))
+        report = load.run(url, paths, args.concurrency, args.duration)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    load.print_report(f"{url} (concurrency={args.concurrency}, duration={args.duration}s)", report)
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        if problems:
+            print("\n效能退步：")
+            for problem in problems:
+                print("  " + problem)
+            sys.exit(1)
+        print("\n與 baseline 相比沒有退步")
+
+
+if __name__ == '__main__':
+    main()
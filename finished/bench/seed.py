@@ -0,0 +1,124 @@
+# 建立壓力測試用的本機資料庫：
+# 用 lesson10/sql 的最新訊息與 114下半年職能進修課程.csv 當種子資料，依 --scale 倍數放大，
+# 再套用 finished/sql 的索引、觸發器與資料版本表，讓測試環境和正式站一樣
+#
+#   python -m bench.seed --database postgresql://localhost/course_bench --scale 200
+import argparse
+import csv
+import io
+import os
+
+import psycopg2
+
+import fulltext
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+LESSON_SQL = os.path.join(APP_DIR, '..', 'lesson10', 'sql')
+COURSE_CSV = os.path.join(LESSON_SQL, '114下半年職能進修課程.csv')
+NEWS_DDL = os.path.join(LESSON_SQL, '建立最新訊息.sql')
+NEWS_DATA = os.path.join(LESSON_SQL, '最新訊息_202505271115.sql')
+
+# 資料載入後才套用的設定檔，順序有關係
+SCHEMA_FILES = [
+    os.path.join(APP_DIR, 'sql', '型別欄位.sql'),
+    os.path.join(APP_DIR, 'sql', '建立索引.sql'),
+    os.path.join(APP_DIR, 'sql', '異動通知.sql'),
+    os.path.join(APP_DIR, 'sql', '全文檢索.sql'),
+    os.path.join(APP_DIR, 'sql', '課程卡片.sql'),
+]
+
+# 最新訊息的 id 是 smallserial，放大後不能超過 32767 筆
+NEWS_MAX_ROWS = 32000
+
+
+def read_sql(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def read_courses():
+    # CSV 在逗號後面有空白才接引號，要用 skipinitialspace 才能正確解析
+    with open(COURSE_CSV, encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, skipinitialspace=True)
+        header = next(reader)
+        return header, list(reader)
+
+
+def scaled_courses(rows, scale, name_index):
+    # 第一份保留原樣，之後每份在課程名稱後加上編號，避免自然鍵重複
+    for n in range(scale):
+        for row in rows:
+            if n == 0:
+                yield row
+            else:
+                copy = list(row)
+                copy[name_index] = f"{row[name_index]} ({n + 1})"
+                yield copy
+
+
+def copy_rows(cur, table, header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    buffer.seek(0)
+    columns = ', '.join(f'"{name}"' for name in header)
+    cur.copy_expert(f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def seed(dsn, scale=1):
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('DROP TABLE IF EXISTS public."進修課程", public.最新訊息, public.資料版本 CASCADE;')
+            cur.execute(read_sql(os.path.join(APP_DIR, 'sql', '建立進修課程.sql')))
+            cur.execute(read_sql(NEWS_DDL))
+
+            header, rows = read_courses()
+            copy_rows(cur, 'public."進修課程"', header,
+                      scaled_courses(rows, scale, header.index('課程名稱')))
+
+            # 匯出檔最後附帶一段示範查詢，只取 INSERT 的部分
+            news_sql = read_sql(NEWS_DATA).split('SELECT 群組')[0]
+            cur.execute(news_sql)
+            cur.execute('SELECT count(*) FROM public.最新訊息;')
+            base = cur.fetchone()[0]
+            copies = min(scale, NEWS_MAX_ROWS // max(base, 1)) - 1
+            if copies > 0:
+                # 複製的訊息把日期往前推，模擬多年累積的公告
+                cur.execute("""
+                    INSERT INTO public.最新訊息 (主題, 上版日期, 內容)
+                    SELECT 主題 || ' #' || n, 上版日期 - n, 內容
+                    FROM public.最新訊息, generate_series(1, %s) AS n;
+                """, (copies,))
+
+            for path in SCHEMA_FILES:
+                cur.execute(read_sql(path))
+            # 全文檢索欄位要用 jieba 斷詞後才有值
+            fulltext.reindex(cur)
+        conn.commit()
+
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cur:
+            cur.execute('ANALYZE public."進修課程"; ANALYZE public."課程卡片"; ANALYZE public.最新訊息;')
+            cur.execute('SELECT (SELECT count(*) FROM public."進修課程"), (SELECT count(*) FROM public.最新訊息);')
+            courses, news = cur.fetchone()
+    finally:
+        conn.close()
+    return courses, news
+
+
+def main():
+    parser = argparse.ArgumentParser(description="建立壓力測試用的課程與最新訊息資料")
+    parser.add_argument('--database', default=os.getenv('BENCH_DATABASE'),
+                        help="PostgreSQL 連線字串 (預設讀 BENCH_DATABASE)")
+    parser.add_argument('--scale', type=int, default=1, help="資料放大倍數")
+    args = parser.parse_args()
+    if not args.database:
+        parser.error("請用 --database 或 BENCH_DATABASE 指定測試資料庫")
+    courses, news = seed(args.database, max(args.scale, 1))
+    print(f"進修課程 {courses} 筆，最新訊息 {news} 筆")
+
+
+if __name__ == '__main__':
+    main()
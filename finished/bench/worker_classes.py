@@ -0,0 +1,103 @@
+# 在同一台機器上比較 gunicorn 各種 worker class 的吞吐量與延遲
+# 每種 class 各啟動一次 gunicorn (gunicorn.conf.py，只換 GUNICORN_WORKER_CLASS)，跑同一組路徑
+#
+#   python -m bench.worker_classes --database postgresql://localhost/course_bench -w 4 -c 32 -d 15
+#   python -m bench.worker_classes --database ... --classes sync gthread --json classes.json
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from bench import load
+from bench.run import build_paths
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG = os.path.join(APP_DIR, 'gunicorn.conf.py')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + '/', timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.3)
+    raise RuntimeError(f"{url} 沒有在 {timeout} 秒內啟動")
+
+
+def start_gunicorn(dsn, worker_class, workers, threads, port, pidfile):
+    env = dict(os.environ,
+               RENDER_DATABASE=dsn,
+               DB_QUERY_HEADER='1',
+               GUNICORN_WORKER_CLASS=worker_class,
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads),
+               GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_PIDFILE=pidfile)
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', CONFIG, 'index:app'],
+                            cwd=APP_DIR, env=env)
+
+
+def bench_class(dsn, worker_class, paths, args):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = start_gunicorn(dsn, worker_class, args.workers, args.threads, port,
+                              os.path.join(tmp, 'gunicorn.pid'))
+        try:
+            wait_ready(url)
+            load.run(url, paths, concurrency=args.concurrency, duration=min(2.0, args.duration))
+            return load.run(url, paths, args.concurrency, args.duration)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 gunicorn worker class 的吞吐量")
+    parser.add_argument('--database', default=os.getenv('BENCH_DATABASE'),
+                        help="測試資料庫連線字串 (預設讀 BENCH_DATABASE)")
+    parser.add_argument('--classes', nargs='+', default=['sync', 'gthread', 'gevent'])
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('-t', '--threads', type=int, default=4, help="gthread 每個 worker 的執行緒數")
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-d', '--duration', type=float, default=15.0)
+    parser.add_argument('--json', dest='json_out', help="把各 class 的整體統計寫成 JSON")
+    args = parser.parse_args()
+    if not args.database:
+        parser.error("請用 --database 或 BENCH_DATABASE 指定測試資料庫")
+
+    paths = build_paths(args.database)
+    results = {}
+    for worker_class in args.classes:
+        report = bench_class(args.database, worker_class, paths, args)
+        load.print_report(f"{worker_class} (workers={args.workers}, concurrency={args.concurrency})", report)
+        print()
+        results[worker_class] = report['*']
+
+    print(f"CPU {multiprocessing.cpu_count()} 核，workers={args.workers}，threads={args.threads}")
+    print(f"{'class':10} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5}")
+    for worker_class, s in results.items():
+        print(f"{worker_class:10} {s['rps']:>8} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {s['errors']:>5}")
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
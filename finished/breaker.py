@@ -0,0 +1,59 @@
+import math
+import threading
+import time
+
+
+class CircuitBreaker:
+    # 斷路器：資料庫連續失敗 failure_threshold 次就斷開，reset_timeout 秒內的請求直接拒絕，
+    # 不再排隊等連線或等查詢逾時；時間到了只放一個請求試探，成功才恢復，失敗就再斷開
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'         # closed / open / half_open
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False           # half_open 時是否已經放出試探的請求
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.rejected = 0
+
+    def allow(self):
+        # 可以放行時回傳 None，否則回傳建議用戶端等待的秒數 (Retry-After)
+        with self._lock:
+            if self.state == 'closed':
+                return None
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == 'open' and remaining <= 0:
+                self.state = 'half_open'
+                self._trial = False
+            if self.state == 'half_open' and not self._trial:
+                self._trial = True
+                return None
+            self.rejected += 1
+            return max(1, math.ceil(remaining))
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = 'closed'
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    def cancel(self):
+        # 請求沒有真的用到資料庫（例如排隊已滿被拒絕），不算成功也不算失敗
+        with self._lock:
+            self._trial = False
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self._failures,
+                    'trips': self.trips, 'rejected': self.rejected}
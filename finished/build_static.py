@@ -0,0 +1,155 @@
+# 靜態檔建置：部署前執行一次，輸出到 static/dist/
+# 1. 檔名加上內容雜湊 (css/base.css -> css/base.1a2b3c4d5e.css)，內容不變檔名就不變
+# 2. 文字檔另外壓成 .gz 與 .br (有安裝 brotli 時)，伺服器直接送出壓好的檔案，不必每次壓縮
+# 3. PNG / JPEG 另外產生多種寬度的 AVIF 與 WebP（需要 Pillow），模板用 picture() 輸出 <picture> 與 srcset
+# 4. 原檔名 -> 雜湊檔名寫進 manifest.json，assets.py 讓 url_for('static', ...) 自動換成雜湊檔名
+#
+#   python build_static.py
+#   python build_static.py --clean   # 先刪除舊的 dist (滾動更新時舊 worker 可能還在用舊檔，平常不要加)
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+import assets
+
+# 值得壓縮的文字檔；圖片與 PDF 本身已經壓縮過
+COMPRESS_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+# 壓縮後至少要省下這個比例才保留壓縮檔
+MIN_SAVING = 0.05
+
+# 轉成響應式圖片的格式；寬度超過原圖的不產生（不放大）
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+IMAGE_WIDTHS = (320, 480, 640, 960, 1280)
+# (副檔名, Pillow 格式, 存檔參數)，依瀏覽器優先選用的順序；Pillow 不支援的格式 (例如沒有 libavif) 會略過
+IMAGE_FORMATS = [
+    ('avif', 'AVIF', {'quality': 50}),
+    ('webp', 'WEBP', {'quality': 80, 'method': 6}),
+]
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def hashed_path(path, digest):
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest}{ext}'
+
+
+def compress(data):
+    # 回傳 {encoding: 壓縮後的內容}，mtime 固定為 0，同樣的內容每次建置結果都一樣
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items()
+            if len(body) <= len(data) * (1 - MIN_SAVING)}
+
+
+def image_variants(name, data):
+    # 回傳 (寬, 高, {格式: [[寬度, 雜湊檔名], ...]})
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        width, height = source.size
+        if source.mode not in ('RGB', 'RGBA'):
+            has_alpha = source.mode in ('LA', 'PA') or 'transparency' in source.info
+            image = source.convert('RGBA' if has_alpha else 'RGB')
+        else:
+            image = source.copy()
+
+    widths = sorted({w for w in IMAGE_WIDTHS if w < width} | {width})
+    root = os.path.splitext(name)[0]
+    variants = {}
+    for ext, pil_format, options in IMAGE_FORMATS:
+        files = []
+        for w in widths:
+            resized = image if w == width else image.resize((w, round(height * w / width)), Image.LANCZOS)
+            buffer = io.BytesIO()
+            try:
+                resized.save(buffer, pil_format, **options)
+            except (KeyError, OSError, ValueError):
+                break
+            body = buffer.getvalue()
+            target = f'{root}.{w}w.{content_hash(body)}.{ext}'
+            write(os.path.join(assets.DIST_DIR, target), body)
+            files.append([w, target])
+        else:
+            variants[ext] = files
+    return width, height, variants
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def source_files():
+    for root, dirs, files in os.walk(assets.STATIC_DIR):
+        # 不處理輸出目錄本身
+        dirs[:] = sorted(d for d in dirs
+                         if os.path.join(root, d) != assets.DIST_DIR and not d.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.'):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, assets.STATIC_DIR).replace(os.sep, '/'), path
+
+
+def build(clean=False):
+    if clean and os.path.isdir(assets.DIST_DIR):
+        shutil.rmtree(assets.DIST_DIR)
+    manifest = {}
+    saved = 0
+    for name, path in source_files():
+        with open(path, 'rb') as f:
+            data = f.read()
+        target = hashed_path(name, content_hash(data))
+        write(os.path.join(assets.DIST_DIR, target), data)
+        encodings = []
+        if os.path.splitext(name)[1].lower() in COMPRESS_EXTENSIONS:
+            for encoding, body in compress(data).items():
+                write(os.path.join(assets.DIST_DIR, target + assets.ENCODING_SUFFIXES[encoding]), body)
+                encodings.append(encoding)
+                if encoding == 'gzip':
+                    saved += len(data) - len(body)
+        manifest[name] = {'file': target, 'encodings': sorted(encodings)}
+        if Image is not None and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+            width, height, variants = image_variants(name, data)
+            manifest[name].update(width=width, height=height, variants=variants)
+
+    with open(assets.MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    return manifest, saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="靜態檔加上內容雜湊並預先壓縮，輸出到 static/dist/")
+    parser.add_argument('--clean', action='store_true', help="先刪除舊的 static/dist/")
+    args = parser.parse_args()
+    manifest, saved = build(args.clean)
+    compressed = sum(1 for item in manifest.values() if item['encodings'])
+    print(f"{len(manifest)} 個檔案，其中 {compressed} 個預先壓縮，gzip 共省下 {saved // 1024} KB")
+    if brotli is None:
+        print("沒有安裝 brotli，只產生 .gz")
+    if Image is None:
+        print("沒有安裝 Pillow，不產生 AVIF / WebP 圖片")
+    else:
+        formats = {ext for item in manifest.values() for ext in item.get('variants', {})}
+        print(f"響應式圖片格式：{', '.join(sorted(formats)) or '無'}")
+
+
+if __name__ == '__main__':
+    main()
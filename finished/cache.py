@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # 行程內的小型快取：每個 key 存活 ttl 秒，也可以隨時手動清除
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}               # key -> (到期時間, 值)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        value = self.peek(key)
+        if value is None:
+            # 在鎖外載入，避免慢查詢卡住其他執行緒讀快取
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def peek(self, key):
+        # 沒有或已過期時回傳 None；非同步程式可以自己 await 載入後再 put
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+class LRUCache:
+    # 依佔用位元組數限制大小的 LRU 快取，用來存放渲染好的 HTML 片段
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()    # key -> (值, 位元組數)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        size = len(str(value).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            # 超過上限就從最久沒用到的開始丟
+            while self._bytes > self.max_bytes:
+                _, (_, dropped) = self._data.popitem(last=False)
+                self._bytes -= dropped
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class SWRCache:
+    # stale-while-revalidate 的讀取快取：
+    # - 超過 soft_ttl 仍然直接回傳舊值，同時交給背景執行緒重新載入
+    # - 背景載入失敗就繼續用舊值，直到超過 hard_ttl 才必須在請求裡同步載入
+    # loader 會在背景執行緒裡呼叫，必須自己取得資料庫連線，不能用請求裡的 cursor
+    def __init__(self, soft_ttl, hard_ttl, max_entries=1000):
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()    # key -> [值, 載入時間, 是否已標記過期, 第幾次標記過期]
+        self._lock = threading.Lock()
+        self._pending = {}            # 等待背景重新載入的 key -> loader
+        self._retry_at = {}           # 背景載入失敗的 key -> 下次可以再試的時間
+        self._expirations = 0         # expire() 被呼叫的次數，沒有舊值的 key 也能知道載入期間有沒有異動
+        self.retry_interval = min(5.0, soft_ttl)
+        self._wakeup = threading.Condition(self._lock)
+        self._refresher_pid = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and now - item[1] < self.hard_ttl:
+                self._data.move_to_end(key)
+                if item[2] or now - item[1] >= self.soft_ttl:
+                    self.stale_hits += 1
+                    self._schedule(key, loader)
+                else:
+                    self.hits += 1
+                return item[0]
+            self.misses += 1
+            expirations = self._expirations
+        # 沒有值或舊值已經超過 hard_ttl：只能在請求裡載入，失敗就讓例外往上丟
+        value = loader()
+        with self._lock:
+            # 和背景載入相同：載入期間有 expire() 的話這個值可能是異動前查的，存起來但維持過期
+            # （key 可能還不在快取裡，分不出是不是這個 key，寧可多載入一次）
+            self._put(key, value, stale=self._expirations != expirations)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key, value, stale=False):
+        # 呼叫時已持有 self._lock；標記過期的次數沿用原本的項目，載入中的人才比對得出來
+        item = self._data.get(key)
+        generation = item[3] if item is not None else 0
+        self._data[key] = [value, time.monotonic(), stale, generation]
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def expire(self, key=None):
+        # 資料有異動時標記為過期（不刪除），下一次讀取會拿到舊值並觸發背景重新載入
+        with self._lock:
+            self._expirations += 1
+            items = self._data.values() if key is None else [self._data[key]] if key in self._data else []
+            for item in items:
+                item[2] = True
+                item[3] += 1
+
+    def _schedule(self, key, loader):
+        # 呼叫時已持有 self._lock；同一個 key 同時只會有一個背景載入
+        if self._refresher_pid != os.getpid():
+            # fork 之後執行緒不會跟過來，每個 worker 行程在第一次需要時自己啟動
+            self._refresher_pid = os.getpid()
+            self._pending.clear()
+            threading.Thread(target=self._refresh_loop, name="swr-refresher", daemon=True).start()
+        if key in self._pending or time.monotonic() < self._retry_at.get(key, 0):
+            return
+        self._pending[key] = loader
+        self._wakeup.notify()
+
+    def _refresh_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                key, loader = next(iter(self._pending.items()))
+                item = self._data.get(key)
+                generation = item[3] if item is not None else 0
+            try:
+                value = loader()
+            except Exception as e:
+                with self._lock:
+                    self.refresh_errors += 1
+                    # 資料庫出問題時不要每個請求都重試
+                    self._retry_at[key] = time.monotonic() + self.retry_interval
+                print("背景更新快取失敗，繼續使用舊資料", key)
+                print(e)
+            else:
+                with self._lock:
+                    # 載入期間又被標記過期（例如收到異動通知）：這個值可能是異動前查的，存起來但維持過期，
+                    # 下一次讀取會再排一次背景載入，不會把這次的失效吃掉
+                    item = self._data.get(key)
+                    self._put(key, value, stale=item is not None and item[3] != generation)
+                    self.refreshes += 1
+                    self._retry_at.pop(key, None)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'pending': len(self._pending),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+            }
@@ -0,0 +1,75 @@
+# 回應壓縮：渲染好的 HTML 與 JSON 依 Accept-Encoding 用 brotli 或 gzip 壓縮
+# 太小的回應、已經壓縮過的格式（圖片、PDF、預先壓好的靜態檔）與串流回應都不處理
+# 壓縮結果與省下的位元組數記在 /metrics
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+from flask import request
+
+import metrics
+
+MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '500'))
+GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+# 動態內容每次都要壓縮，brotli 用中等品質，壓縮率已經比 gzip 好又不會太吃 CPU
+BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '5'))
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+    'application/json', 'image/svg+xml',
+}
+# 伺服器支援的編碼，依偏好順序
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def should_compress(response):
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    # send_file 與串流回應的內容不在記憶體裡，整個讀出來壓縮反而更慢；
+    # 串流路由會加上 X-Accel-Buffering: no，Quart 的回應沒有 is_streamed 只能靠這個判斷
+    if response.headers.get('X-Accel-Buffering') == 'no':
+        return False
+    return not (getattr(response, 'direct_passthrough', False) or getattr(response, 'is_streamed', False))
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def apply(response, data, accept_encodings):
+    # 內容會隨 Accept-Encoding 不同，快取 (瀏覽器、CDN) 要分開存
+    response.vary.add('Accept-Encoding')
+    if len(data) < MIN_SIZE:
+        metrics.COMPRESSION_RESPONSES.inc(1, 'too_small')
+        return response
+    encoding = accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        metrics.COMPRESSION_RESPONSES.inc(1, 'not_accepted')
+        return response
+
+    body = compress(data, encoding)
+    metrics.COMPRESSION_RESPONSES.inc(1, encoding)
+    metrics.COMPRESSION_BYTES.inc(len(data), 'original')
+    metrics.COMPRESSION_BYTES.inc(len(body), 'compressed')
+    response.set_data(body)
+    response.content_encoding = encoding
+    # 壓縮後的內容不同，強 ETag 改成弱 ETag（conditional.py 用弱比對，304 照樣有效）
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    @app.after_request
+    def _compress(response):
+        if should_compress(response):
+            apply(response, response.get_data(), request.accept_encodings)
+        return response
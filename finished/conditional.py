@@ -0,0 +1,84 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from flask import make_response, request
+from psycopg2 import errors
+
+import assets
+import queries
+
+# 頁面內容 = 資料 + 模板 + 靜態檔網址；模板或靜態檔改版時 ETag 也要跟著變，
+# 用模板內容與靜態檔 manifest (build_static.py) 的雜湊，同一次部署的每個 worker 算出來都一樣
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+def _template_fingerprint():
+    digest = hashlib.sha1()
+    latest = 0.0
+    paths = [os.path.join(root, name)
+             for root, _, files in sorted(os.walk(TEMPLATE_DIR)) for name in sorted(files)]
+    # 只改 CSS / JS / 圖片的部署：頁面裡的雜湊檔名變了，不能再讓瀏覽器用舊的 HTML (304)
+    if os.path.exists(assets.MANIFEST_PATH):
+        paths.append(assets.MANIFEST_PATH)
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        latest = max(latest, os.path.getmtime(path))
+    return digest.hexdigest()[:12], datetime.fromtimestamp(int(latest), timezone.utc)
+
+
+TEMPLATE_HASH, TEMPLATE_MTIME = _template_fingerprint()
+
+
+_missing_warned = False
+
+
+def table_version(cur, table):
+    # 資料版本表由 sql/異動通知.sql 的觸發器維護，每次寫入都會加 1
+    # 回傳 (版本號, 更新時間)；表裡沒有這張表的列、或還沒套用 sql/異動通知.sql 時回傳 None（不產生 ETag）
+    global _missing_warned
+    try:
+        cur.execute(queries.TABLE_VERSION, (table,))
+    except errors.UndefinedTable:
+        # 查詢失敗後交易已中止，先 rollback，同一條連線後面的查詢才能繼續
+        cur.connection.rollback()
+        if not _missing_warned:
+            _missing_warned = True
+            print("找不到資料版本表，請執行 sql/異動通知.sql；在那之前頁面不會回 304")
+        return None
+    return cur.fetchone()
+
+
+def validators(version, *extra):
+    # 回傳 (etag, last_modified)；version 是 table_version() 的結果
+    number, updated = version
+    etag = '-'.join([TEMPLATE_HASH, str(number), *map(str, extra)])
+    last_modified = max(updated.replace(microsecond=0), TEMPLATE_MTIME)
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified, req=None):
+    # 有 If-None-Match 時以 ETag 為準，否則才看 If-Modified-Since
+    # req 預設是 Flask 的 request；非同步版 (Quart) 會傳入自己的 request
+    if req is None:
+        req = request
+    if req.if_none_match:
+        # 弱比對：compression.py 壓縮過的回應會把 ETag 改成弱 ETag
+        return req.if_none_match.contains_weak(etag)
+    if req.if_modified_since:
+        return last_modified <= req.if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # 允許瀏覽器與 CDN 快取，但每次使用前都要回來驗證（便宜的 304）
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    return set_validators(make_response('', 304), etag, last_modified)
@@ -0,0 +1,49 @@
+# 課程卡片實體化檢視 (sql/課程卡片.sql) 的重新整理，匯入程式與網站共用
+# 資料版本表的「課程卡片」列記錄檢視是依哪一個 進修課程 版本整理的，
+# 比 進修課程 的版本舊才需要重新整理；多個 worker 同時收到通知時用 advisory lock 只讓一個去做
+CARDS_VIEW = 'public."課程卡片"'
+# pg_advisory_xact_lock 的 key，任意固定的數字
+LOCK_KEY = 7_208_101
+
+VERSIONS = """
+SELECT
+    (SELECT "版本" FROM public."資料版本" WHERE "表名" = '進修課程'),
+    (SELECT "版本" FROM public."資料版本" WHERE "表名" = '課程卡片');
+"""
+
+
+def lock(cur):
+    # 會寫入 進修課程 的交易要在寫入前先取得，和網站的重新整理 (會更新資料版本) 固定同一個順序，避免互相等待而死結
+    cur.execute('SELECT pg_advisory_xact_lock(%s);', (LOCK_KEY,))
+
+
+def refresh(cur, wait=True, bump=False):
+    # 在目前的交易裡重新整理，commit 之後才生效；回傳 True 已整理、False 已經是最新、None 別人正在整理 (wait=False)
+    # bump=True：整理完把 進修課程 的版本再加 1 並通知各 worker，
+    # 在「課程已異動、檢視還沒整理」期間以新版本號快取的舊卡片就不會再被使用
+    if wait:
+        lock(cur)
+    else:
+        cur.execute('SELECT pg_try_advisory_xact_lock(%s);', (LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            return None
+    cur.execute(VERSIONS)
+    courses, cards = cur.fetchone()
+    if courses is not None and cards is not None and cards >= courses:
+        return False
+    # CONCURRENTLY：整理期間網站照常讀取舊內容
+    cur.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {CARDS_VIEW};')
+    if bump:
+        cur.execute("""
+            UPDATE public."資料版本" SET "版本" = "版本" + 1, "更新時間" = now()
+            WHERE "表名" = '進修課程' RETURNING "版本";
+        """)
+        row = cur.fetchone()
+        courses = row[0] if row is not None else courses
+        cur.execute("SELECT pg_notify('course_changed', 'cards_refreshed');")
+    if courses is not None:
+        cur.execute("""
+            INSERT INTO public."資料版本" ("表名", "版本") VALUES ('課程卡片', %s)
+            ON CONFLICT ("表名") DO UPDATE SET "版本" = EXCLUDED."版本", "更新時間" = now();
+        """, (courses,))
+    return True
@@ -0,0 +1,415 @@
+import logging
+import os
+import select
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import OperationalError
+from psycopg2 import extensions
+from psycopg2 import extras
+
+import metrics
+import queries
+from breaker import CircuitBreaker
+
+# 載入 .env 檔案
+load_dotenv()
+conn_string = os.getenv('RENDER_DATABASE')
+
+# 連線池設定，可用環境變數調整，方便依 gunicorn worker 數量估算總連線數
+# 總連線數上限約為 worker 數 × DB_POOL_MAX
+POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX = int(os.getenv('DB_POOL_MAX', '5'))
+# 等待連線的期限與排隊上限：資料庫變慢時請求很快失敗 (503)，不會把 gunicorn worker 全部卡住
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '2'))
+POOL_MAX_WAITERS = int(os.getenv('DB_POOL_MAX_WAITERS', '16'))
+# 連線閒置超過這個秒數，借出前才用 SELECT 1 確認還活著
+POOL_CHECK_IDLE = float(os.getenv('DB_POOL_CHECK_IDLE', '30'))
+# 查詢超過這個毫秒數就記一筆警告，0 表示不記
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '0'))
+# 是否開一條專用連線 LISTEN 資料異動通知（見 sql/異動通知.sql）
+LISTEN_ENABLED = os.getenv('DB_LISTEN', '1') == '1'
+# 建立連線與單一查詢的時間上限，0 表示不限制
+CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '3'))
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '5000'))
+CONNECT_OPTIONS = {'connect_timeout': CONNECT_TIMEOUT,
+                   'options': f'-c statement_timeout={STATEMENT_TIMEOUT_MS}'}
+# queries.PREPARED 的查詢在每條連線上 PREPARE 一次，之後用 EXECUTE 執行；DB_PREPARE=0 關閉
+PREPARE_ENABLED = os.getenv('DB_PREPARE', '1') == '1'
+# 斷路器：連續失敗幾次後斷開、斷開幾秒後再試
+BREAKER_FAILURES = int(os.getenv('DB_BREAKER_FAILURES', '5'))
+BREAKER_RESET = float(os.getenv('DB_BREAKER_RESET', '10'))
+
+
+# 每個請求執行了幾個查詢；請求在同一個執行緒裡跑，所以用 thread-local 計數
+_request_stats = threading.local()
+
+
+def reset_query_count():
+    _request_stats.queries = 0
+
+
+def query_count():
+    return getattr(_request_stats, 'queries', 0)
+
+
+logger = logging.getLogger('db')
+
+
+class PreparingConnection(extensions.connection):
+    # 記住這條連線已經 PREPARE 過哪些查詢；預備陳述式屬於資料庫 session，rollback 也不會消失
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class InstrumentedCursor(extensions.cursor):
+    # 計算每個請求的查詢數，並把每個查詢的時間與取回筆數記到 /metrics
+    def execute(self, query, vars=None):
+        _request_stats.queries = getattr(_request_stats, 'queries', 0) + 1
+        name = queries.name_of(query)
+        # 具名 cursor (DECLARE ... CURSOR FOR) 不能接 EXECUTE，照原本的 SQL 執行
+        if PREPARE_ENABLED and name in queries.PREPARED and self.name is None:
+            query = self._prepared(name)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.QUERY_SECONDS.observe(elapsed, name)
+            # psycopg2 的一般 cursor 在 execute 時就把結果全部取回，rowcount 就是筆數
+            if self.description is not None and self.rowcount > 0:
+                metrics.ROWS_FETCHED.inc(self.rowcount, name)
+            if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+                logger.warning("慢查詢 %s 花了 %.1f ms，取回 %s 筆", name, elapsed * 1000, self.rowcount)
+
+    def _prepared(self, name):
+        prepared = getattr(self.connection, 'prepared', None)
+        if prepared is None:
+            # 不是連線池建立的連線（例如匯入程式自己 connect 的）
+            return getattr(queries, name)
+        if name not in prepared:
+            super().execute(queries.prepare_sql(name))
+            prepared.add(name)
+        return queries.execute_sql(name)
+
+
+class DictCursor(InstrumentedCursor, extras.RealDictCursor):
+    # 每一列直接建成 {欄位名稱: 值}（JSON API 用），一樣記錄查詢數與時間
+    pass
+
+
+class Unavailable(Exception):
+    # 資料庫暫時不能用（忙碌或斷路器斷開），網站回 503 並帶 Retry-After
+    # 不繼承 OperationalError：路由的「資料庫錯誤」(500) 不會接住它，交給 app 的 errorhandler
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PoolTimeout(Unavailable):
+    pass
+
+
+class QueueFull(Unavailable):
+    pass
+
+
+class CircuitOpen(Unavailable):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, dsn, minconn=POOL_MIN, maxconn=POOL_MAX,
+                 timeout=POOL_TIMEOUT, check_idle=POOL_CHECK_IDLE, max_waiters=POOL_MAX_WAITERS):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_waiters = max_waiters
+        self._waiting = 0
+        self._idle = deque()          # (連線, 歸還時間)
+        self._in_use = set()
+        self._cond = threading.Condition()
+        self._opening = 0             # 正在建立中的連線數
+        self._closed = False
+        # 統計資料
+        self._checkouts = 0
+        self._timeouts = 0
+        self._rejected = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn, connection_factory=PreparingConnection,
+                                cursor_factory=InstrumentedCursor, **CONNECT_OPTIONS)
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _is_alive(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("連線池已關閉")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    self._in_use.add(conn)
+                    break
+                if self._size() < self.maxconn:
+                    # 先佔名額再到鎖外建立連線，避免握手期間卡住其他執行緒
+                    self._opening += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    metrics.DB_REJECTED.inc(1, 'pool_timeout')
+                    raise PoolTimeout(f"等待資料庫連線逾時 ({self.timeout} 秒)")
+                if self._waiting >= self.max_waiters:
+                    # 排隊的人已經太多，再等也來不及，直接拒絕
+                    self._rejected += 1
+                    metrics.DB_REJECTED.inc(1, 'queue_full')
+                    raise QueueFull(f"等待資料庫連線的請求超過 {self.max_waiters} 個")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        if conn is not None and not self._is_alive(conn, idle_since):
+            # 健康檢查失敗：丟掉舊連線，名額直接轉給重新建立的連線
+            with self._cond:
+                self._in_use.discard(conn)
+                self._discarded += 1
+                self._opening += 1
+            self._close_quietly(conn)
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            finally:
+                with self._cond:
+                    self._opening -= 1
+                    if conn is not None:
+                        self._in_use.add(conn)
+                    else:
+                        self._cond.notify()
+
+        waited = time.monotonic() - start
+        metrics.POOL_WAIT_SECONDS.observe(waited)
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                # 查詢會隱含開啟交易，歸還前一定要結束，避免 idle in transaction
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed or self._closed:
+            with self._cond:
+                self._in_use.discard(conn)
+                self._discarded += 1
+                self._cond.notify()
+            self._close_quietly(conn)
+            return
+        with self._cond:
+            self._in_use.discard(conn)
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        # 保證一定會歸還連線；壞掉的連線在 putconn 裡會被丟棄
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pid': os.getpid(),
+                'min': self.minconn,
+                'max': self.maxconn,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waiting': self._waiting,
+                'timeouts': self._timeouts,
+                'rejected': self._rejected,
+                'discarded': self._discarded,
+                'wait_total_ms': round(self._wait_total * 1000, 3),
+                'wait_avg_ms': round(self._wait_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000, 3),
+            }
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+
+# 每個 worker 行程各自一個連線池；fork 之後 pid 不同就重新建立
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(dsn=None, **kwargs):
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            return _pool
+        _pool = ConnectionPool(dsn or conn_string, **kwargs)
+        _pool_pid = os.getpid()
+    start_listener(dsn)
+    return _pool
+
+
+def get_pool():
+    if _pool is None or _pool_pid != os.getpid():
+        return init_pool()
+    return _pool
+
+
+def pool_stats():
+    # 給 /metrics 與 /pool_stats：只讀現有的連線池，不會為了回報狀態去連資料庫；還沒建立時回傳 None
+    pool = _pool if _pool_pid == os.getpid() else None
+    return pool.stats() if pool is not None else None
+
+
+def close_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _pool_pid = None
+
+
+# 每個 worker 一個斷路器，連線失敗、查詢逾時 (statement_timeout) 與等不到連線都算失敗
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET)
+
+
+@contextmanager
+def get_conn():
+    retry_after = breaker.allow()
+    if retry_after is not None:
+        metrics.DB_REJECTED.inc(1, 'circuit_open')
+        raise CircuitOpen("資料庫暫時無法使用", retry_after)
+    outcome = breaker.success
+    try:
+        with get_pool().connection() as conn:
+            yield conn
+    except QueueFull:
+        # 只是這個 worker 太忙，不代表資料庫有問題
+        outcome = breaker.cancel
+        raise
+    except (OperationalError, PoolTimeout):
+        outcome = breaker.failure
+        raise
+    finally:
+        outcome()
+
+
+# ---- LISTEN/NOTIFY：資料表異動時通知各 worker 清除快取 ----
+_listeners = {}               # channel -> [callback(payload)]
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def on_notify(channel, callback):
+    # 註冊通知的處理函式；可以在 import 時呼叫，真正的 LISTEN 執行緒在 fork 後才啟動
+    with _listener_lock:
+        _listeners.setdefault(channel, []).append(callback)
+
+
+def _dispatch(channel, payload):
+    for callback in _listeners.get(channel, []):
+        try:
+            callback(payload)
+        except Exception as e:
+            print("通知處理失敗", channel, e)
+
+
+def _listen_loop(dsn):
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(dsn)
+            conn.set_session(autocommit=True)
+            with conn.cursor() as cur:
+                for channel in list(_listeners):
+                    cur.execute(f'LISTEN "{channel}";')
+            # 重新連上時可能漏掉通知，全部清一次比較保險
+            for channel in list(_listeners):
+                _dispatch(channel, None)
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    _dispatch(notify.channel, notify.payload)
+        except Exception:
+            # 不只資料庫錯誤，select 的 OSError 等也一樣重新連線，否則執行緒結束後就再也收不到通知
+            logger.warning("LISTEN 連線中斷，5 秒後重試", exc_info=True)
+        finally:
+            if conn is not None:
+                conn.close()
+        time.sleep(5)
+
+
+def start_listener(dsn=None):
+    global _listener_pid
+    if not LISTEN_ENABLED:
+        return
+    with _listener_lock:
+        if not _listeners or _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+    thread = threading.Thread(target=_listen_loop, args=(dsn or conn_string,),
+                              name="db-listener", daemon=True)
+    thread.start()
@@ -0,0 +1,148 @@
+# 中文全文檢索：用 jieba 斷詞，把詞連同位置與權重寫進「搜尋詞」tsvector 欄位 (sql/全文檢索.sql)
+# 文件用搜尋引擎模式斷詞（長詞也會再切出短詞），查詢用精確模式，查詢的詞一定會出現在文件的詞裡
+# 詞在 Python 組成 tsvector / tsquery 的文字格式後直接轉型，不經過 PostgreSQL 的斷詞器
+#
+#   python fulltext.py            # 補上還沒斷詞的資料（新增或文字被修改過的列）
+#   python fulltext.py --all      # 全部重新斷詞，例如更新 jieba 詞典之後
+import argparse
+import re
+import sys
+
+import jieba
+import psycopg2
+from psycopg2.extras import execute_values
+from markupsafe import Markup, escape
+
+import db
+
+# 資料表 -> 要搜尋的欄位與權重 (A 最重要)
+TABLES = {
+    '進修課程': ('public."進修課程"', [('課程名稱', 'A'), ('就業方向', 'B'), ('課程內容', 'C')]),
+    '最新訊息': ('public.最新訊息', [('主題', 'A'), ('內容', 'B')]),
+}
+
+# tsvector 的限制：位置最大 16383，每個詞最多記 256 個位置
+MAX_POSITION = 16383
+MAX_POSITIONS_PER_WORD = 256
+
+WORD = re.compile(r'\w')
+
+
+def tokenize(text, for_search=True):
+    # 去掉空白與標點，英文一律轉小寫
+    if not text:
+        return []
+    words = jieba.lcut_for_search(text) if for_search else jieba.lcut(text)
+    return [word.strip().lower() for word in words if WORD.search(word)]
+
+
+def _quote(word):
+    return "'" + word.replace('\\', '\\\\').replace("'", "''") + "'"
+
+
+def to_tsvector(fields):
+    # fields 是 [(文字, 權重), ...]，回傳 tsvector 的文字格式，例如 '資料':1A '分析':2A,7C
+    positions = {}
+    position = 0
+    for text, weight in fields:
+        for word in tokenize(text):
+            position += 1
+            if position > MAX_POSITION:
+                break
+            items = positions.setdefault(word, [])
+            if len(items) < MAX_POSITIONS_PER_WORD:
+                items.append(f'{position}{weight}')
+    return ' '.join(f"{_quote(word)}:{','.join(items)}" for word, items in positions.items())
+
+
+def query_terms(query):
+    # 使用者輸入的查詢切成詞，重複的只留一個
+    return list(dict.fromkeys(tokenize(query, for_search=False)))
+
+
+def to_tsquery(terms):
+    # 每個詞都要出現；用前綴比對，「資料」也能找到「資料庫」
+    return ' & '.join(f'{_quote(term)}:*' for term in terms)
+
+
+def highlight(text, terms, width=100):
+    # 取出第一個命中的詞附近的一段文字，命中的詞用 <mark> 標示，其餘內容一律跳脫
+    if not text:
+        return ''
+    text = ' '.join(text.split())
+    lowered = text.lower()
+    found = [lowered.find(term) for term in terms if term in lowered]
+    start = max(0, min(found) - width // 4) if found else 0
+    snippet = text[start:start + width]
+
+    parts = [Markup('…')] if start > 0 else []
+    last = 0
+    if terms:
+        pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)),
+                             re.IGNORECASE)
+        for match in pattern.finditer(snippet):
+            parts.append(escape(snippet[last:match.start()]))
+            parts.append(Markup('<mark>%s</mark>') % match.group())
+            last = match.end()
+    parts.append(escape(snippet[last:]))
+    if start + width < len(text):
+        parts.append(Markup('…'))
+    return Markup('').join(parts)
+
+
+def index_pending(cur, table, batch_size=500, skip_locked=False):
+    # 「搜尋詞」是 NULL 的列分批斷詞寫回；FOR UPDATE 鎖住這批資料，ctid 在交易結束前不會變
+    # skip_locked：網站的多個 worker 同時收到異動通知時各做各的，不互相等待
+    name, fields = TABLES[table]
+    columns = ', '.join(f'"{column}"' for column, _ in fields)
+    weights = [weight for _, weight in fields]
+    total = 0
+    while True:
+        cur.execute(f"""
+            SELECT ctid::text, {columns} FROM {name}
+            WHERE "搜尋詞" IS NULL
+            LIMIT %s FOR UPDATE{' SKIP LOCKED' if skip_locked else ''};
+        """, (batch_size,))
+        rows = cur.fetchall()
+        if not rows:
+            return total
+        values = [(row[0], to_tsvector(zip(row[1:], weights))) for row in rows]
+        execute_values(cur, f"""
+            UPDATE {name} t SET "搜尋詞" = v.詞::tsvector
+            FROM (VALUES %s) AS v(列, 詞)
+            WHERE t.ctid = v.列::tid;
+        """, values)
+        total += len(rows)
+
+
+def reindex(cur, tables=None, rebuild=False):
+    counts = {}
+    for table in tables or TABLES:
+        if rebuild:
+            cur.execute(f'UPDATE {TABLES[table][0]} SET "搜尋詞" = NULL WHERE "搜尋詞" IS NOT NULL;')
+        counts[table] = index_pending(cur, table)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用 jieba 斷詞，更新課程與最新訊息的全文檢索欄位")
+    parser.add_argument('--database', help="PostgreSQL 連線字串 (預設讀 .env 的 RENDER_DATABASE)")
+    parser.add_argument('--all', action='store_true', help="全部重新斷詞")
+    args = parser.parse_args()
+
+    try:
+        conn = psycopg2.connect(args.database or db.conn_string)
+        try:
+            with conn, conn.cursor() as cur:
+                counts = reindex(cur, rebuild=args.all)
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        print("斷詞失敗")
+        print(e)
+        sys.exit(1)
+    print('，'.join(f"{table} {count} 筆" for table, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# gunicorn 設定，正式環境用 python serve.py 啟動（或 gunicorn -c gunicorn.conf.py index:app）
+# 所有設定都可以用環境變數調整，Render 之類的平台會用 PORT 指定埠號
+import multiprocessing
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+pidfile = os.getenv('GUNICORN_PIDFILE', '/tmp/pythonweb-gunicorn.pid')
+
+# sync：一個 worker 一次處理一個請求；gthread：每個 worker 開 threads 個執行緒；
+# gevent：協程，一個 worker 同時處理 worker_connections 個請求（需要 gevent 與 psycogreen）
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+# HUP / 升級時舊 worker 最多等這麼久把手上的請求做完
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# 在 master 載入 index.py（模板、jieba、SQL 等），fork 出來的 worker 以 copy-on-write 共用這些記憶體
+# gevent 要在載入程式之前先 monkey patch，不能 preload
+preload_app = worker_class != 'gevent'
+
+# worker 啟動時預熱資料的時間上限，要比 timeout 短，不然 worker 還沒開始處理請求就被 master 當成卡住
+WARM_UP_BUDGET = float(os.getenv('WARM_UP_BUDGET', str(timeout / 2)))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def _open_pool(log, pid):
+    # 連線與 LISTEN 執行緒不能跨 fork 共用，每個 worker 在自己的行程裡建立
+    # 資料庫連不上也要讓 worker 正常啟動：例外跑出 hook 的話 gunicorn 會判定開機失敗並停掉整個服務，
+    # 連線池改由第一個請求的 db.get_pool() 建立，期間由斷路器與 stale 快取撐著
+    import db
+    try:
+        pool = db.init_pool()
+    except Exception as e:
+        log.warning("worker %s 無法建立連線池，第一個請求時再試：%s", pid, e)
+        return False
+    log.info("worker %s 已建立連線池 (min=%s, max=%s)", pid, pool.minconn, pool.maxconn)
+    return True
+
+
+def when_ready(server):
+    # preload 時 index 已經在 master 載入：模板與 jieba 詞典在這裡預熱一次，worker fork 後直接共用
+    if preload_app:
+        import warmup
+        from index import app
+        warmup.run(server.log, app, data=False)
+
+
+def post_worker_init(worker):
+    # gevent 的 monkey patch 在 post_fork 之後才執行，連線池要等 patch 完才能建立，
+    # psycopg2 也要換成會讓出協程的等待方式
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    pool_ready = _open_pool(worker.log, worker.pid)
+    # 快取的資料每個 worker 各自一份，要在自己的行程裡載入；做完才開始接受請求
+    # 有時間上限，每載入一項就通知 master 這個 worker 還活著；連不上資料庫就不預熱資料
+    import warmup
+    warmup.run(worker.log, worker.wsgi, templates=not preload_app, data=pool_ready,
+               budget=WARM_UP_BUDGET, heartbeat=worker.notify)
+
+
+def worker_exit(server, worker):
+    import db
+    db.close_pool()
@@ -0,0 +1,186 @@
+# 把進修課程 CSV 匯入資料庫：
+# 1. 用 COPY 串流寫進暫存表（不必整個檔案讀進記憶體，也不用一筆一筆 INSERT）
+# 2. 以「課程名稱 + 課程開始日期」當自然鍵，和正式表比對
+# 3. 只 UPDATE 內容有變的課程、只 INSERT 新課程，沒變的完全不動
+# 人數、時數、費用與民國日期換算成的數字/時間欄位是資料庫的產生欄位 (sql/型別欄位.sql)，
+# 寫入時自動解析，這裡只需要匯入 CSV 原本的文字欄位
+# 新增或文字有改變的課程，在同一個交易裡用 jieba 斷詞寫進全文檢索欄位 (fulltext.py)，
+# 並重新整理 /classes 讀取的課程卡片實體化檢視 (sql/課程卡片.sql)
+#
+#   python import_courses.py ../lesson10/sql/114下半年職能進修課程.csv
+#   python import_courses.py 課程.csv --database postgresql://... --dry-run
+import argparse
+import csv
+import io
+import sys
+import time
+
+import psycopg2
+
+import course_cards
+import db
+import fulltext
+
+TABLE = 'public."進修課程"'
+STAGING = '"進修課程_匯入"'
+KEY_COLUMNS = ['課程名稱', '課程開始日期']
+
+
+class CsvStream:
+    # 把一列一列的資料轉成 COPY 讀得懂的檔案物件，每次只在記憶體放一小段
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._pending = ''
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _next_line(self):
+        row = next(self._rows, None)
+        if row is None:
+            return None
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._writer.writerow(row)
+        return self._buffer.getvalue()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            line = self._next_line()
+            if line is None:
+                break
+            self._pending += line
+        if size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def read_csv(path):
+    # 原始 CSV 在逗號後面有空白才接引號，要用 skipinitialspace 才能正確解析
+    f = open(path, encoding='utf-8-sig', newline='')
+    reader = csv.reader(f, skipinitialspace=True)
+    header = [name.strip() for name in next(reader)]
+    missing = [name for name in KEY_COLUMNS if name not in header]
+    if missing:
+        f.close()
+        raise ValueError(f"CSV 缺少自然鍵欄位：{', '.join(missing)}")
+    width = len(header)
+    # 欄位數不對的列補齊或截斷，避免 COPY 整批失敗
+    rows = ((row + [''] * width)[:width] for row in reader if any(cell.strip() for cell in row))
+    return f, header, rows
+
+
+def upsert(cur, header):
+    columns = ', '.join(quote(name) for name in header)
+    key_match = ' AND '.join(f't.{quote(name)} = s.{quote(name)}' for name in KEY_COLUMNS)
+    target_row = ', '.join(f't.{quote(name)}' for name in header)
+    source_row = ', '.join(f's.{quote(name)}' for name in header)
+    assignments = ', '.join(f'{quote(name)} = s.{quote(name)}' for name in header)
+
+    # 沒有自然鍵的列無法比對，直接略過
+    cur.execute(f"""
+        DELETE FROM {STAGING}
+        WHERE {' OR '.join(f'{quote(name)} IS NULL' for name in KEY_COLUMNS)};
+    """)
+    skipped = cur.rowcount
+    # 同一份 CSV 裡自然鍵重複時以最後一列為準
+    key_columns = ', '.join(quote(name) for name in KEY_COLUMNS)
+    cur.execute(f"""
+        DELETE FROM {STAGING}
+        WHERE "_列號" NOT IN (SELECT max("_列號") FROM {STAGING} GROUP BY {key_columns});
+    """)
+    cur.execute(f'SELECT count(*) FROM {STAGING};')
+    staged = cur.fetchone()[0]
+
+    # 先算出要更新與新增的筆數；沒有需要時連 UPDATE / INSERT 都不執行，
+    # 觸發器（資料版本、快取通知）也就不會被觸發
+    cur.execute(f"""
+        SELECT
+            count(*) FILTER (WHERE t.ctid IS NOT NULL AND ({target_row}) IS DISTINCT FROM ({source_row})),
+            count(*) FILTER (WHERE t.ctid IS NULL)
+        FROM {STAGING} s
+        LEFT JOIN {TABLE} t ON {key_match};
+    """)
+    to_update, to_insert = cur.fetchone()
+
+    updated = inserted = 0
+    if to_update:
+        cur.execute(f"""
+            UPDATE {TABLE} t SET {assignments}
+            FROM {STAGING} s
+            WHERE {key_match} AND ({target_row}) IS DISTINCT FROM ({source_row});
+        """)
+        updated = cur.rowcount
+    if to_insert:
+        cur.execute(f"""
+            INSERT INTO {TABLE} ({columns})
+            SELECT {source_row} FROM {STAGING} s
+            WHERE NOT EXISTS (SELECT 1 FROM {TABLE} t WHERE {key_match});
+        """)
+        inserted = cur.rowcount
+    return {'inserted': inserted, 'updated': updated,
+            'unchanged': staged - inserted - updated, 'skipped': skipped}
+
+
+def import_csv(path, dsn=None, dry_run=False):
+    f, header, rows = read_csv(path)
+    conn = psycopg2.connect(dsn or db.conn_string)
+    try:
+        with conn.cursor() as cur:
+            course_cards.lock(cur)
+            cur.execute(f"""
+                CREATE TEMP TABLE {STAGING} (LIKE {TABLE}) ON COMMIT DROP;
+                ALTER TABLE {STAGING} ADD COLUMN "_列號" bigserial;
+            """)
+            columns = ', '.join(quote(name) for name in header)
+            cur.copy_expert(f'COPY {STAGING} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                            CsvStream(rows))
+            result = upsert(cur, header)
+            # 試算時不會寫入，不必花時間斷詞
+            result['tokenized'] = 0 if dry_run else fulltext.index_pending(cur, '進修課程')
+            # 沒有新增或更新就不必重新整理
+            result['refreshed'] = not dry_run and bool(result['inserted'] or result['updated'])
+            if result['refreshed']:
+                # 和課程異動一起在 commit 時生效；網站收到通知時會看到檢視已經是最新，不會再整理一次
+                course_cards.refresh(cur)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        f.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用 COPY 匯入進修課程 CSV，只更新有變動的課程")
+    parser.add_argument('csv_path')
+    parser.add_argument('--database', help="PostgreSQL 連線字串 (預設讀 .env 的 RENDER_DATABASE)")
+    parser.add_argument('--dry-run', action='store_true', help="只計算筆數，不寫入")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        result = import_csv(args.csv_path, args.database, args.dry_run)
+    except (OSError, ValueError, psycopg2.Error) as e:
+        print("匯入失敗")
+        print(e)
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    prefix = "(試算) " if args.dry_run else ""
+    print(f"{prefix}新增 {result['inserted']} 筆，更新 {result['updated']} 筆，"
+          f"未變動 {result['unchanged']} 筆，略過 {result['skipped']} 筆，"
+          f"斷詞 {result['tokenized']} 筆，{'已' if result['refreshed'] else '未'}重新整理課程卡片，"
+          f"耗時 {elapsed:.2f} 秒")
+
+
+if __name__ == '__main__':
+    main()
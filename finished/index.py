@@ -1,14 +1,222 @@
-from flask import Flask,render_template,request
+from flask import Flask,render_template,request,jsonify,make_response,Response,stream_template
 import os
-from dotenv import load_dotenv
-import psycopg2
-from psycopg2 import OperationalError
+import threading
+import time
+from markupsafe import Markup
+from psycopg2 import OperationalError, errors
 
-# 載入 .env 檔案
-load_dotenv()
-conn_string = os.getenv('RENDER_DATABASE')
+import api
+import assets
+import compression
+import course_cards
+import db
+import conditional
+import fulltext
+import metrics
+import profiler
+import queries
+import search
+import warmup
+from cache import LRUCache, SWRCache
 
 app = Flask(__name__)
+metrics.init_app(app)
+# PROFILE_SAMPLE_RATE / PROFILE_TOKEN 開啟取樣式效能分析，結果從 /profile 下載 (profiler.py)
+profiler.init_app(app)
+# 部署前執行 build_static.py 後，靜態檔改用雜湊檔名並長期快取
+assets.init_app(app)
+# HTML 與 JSON 依 Accept-Encoding 壓縮（COMPRESS_MIN_SIZE、COMPRESS_GZIP_LEVEL、COMPRESS_BROTLI_QUALITY）
+compression.init_app(app)
+# /api/v1 的 JSON API (api.py)
+api.init_app(app)
+# 模板 bytecode 存到磁碟，重新啟動時不必重新編譯 (warmup.py)
+warmup.init_app(app)
+
+# 路由查詢結果的 stale-while-revalidate 快取：超過 SWR_SOFT_TTL 秒先回舊資料，再由背景執行緒重新查詢；
+# 資料庫暫時連不上時，舊資料最多再用到 SWR_HARD_TTL 秒，使用者不會看到錯誤頁
+# 除了資料版本本身，每個 key 都帶資料版本號，版本一變就是新的 key，內容不會和 ETag 對不上
+data_cache = SWRCache(soft_ttl=float(os.getenv('SWR_SOFT_TTL', '30')),
+                      hard_ttl=float(os.getenv('SWR_HARD_TTL', '3600')),
+                      max_entries=int(os.getenv('SWR_MAX_ENTRIES', '2000')))
+# 收到資料異動通知（sql/異動通知.sql 的觸發器）就把資料版本標成過期，下一個請求會觸發背景更新
+db.on_notify('course_changed', lambda payload: on_course_changed(payload))
+db.on_notify('news_changed', lambda payload: on_news_changed(payload))
+
+COURSES_PER_PAGE = 6
+NEWS_PER_PAGE = 10
+
+# 渲染好的課程卡片 + 分頁 HTML，以 (類別, 頁碼, 資料版本) 為 key，依位元組數上限做 LRU
+cards_cache = LRUCache(max_bytes=int(os.getenv('CARDS_CACHE_BYTES', str(4 * 1024 * 1024))))
+db.on_notify('course_changed', lambda payload: cards_cache.invalidate())
+
+# 壓力測試時打開，回應會帶 X-DB-Queries 標頭，bench 用來統計每個路由的查詢數
+DB_QUERY_HEADER = os.getenv('DB_QUERY_HEADER') == '1'
+
+@app.before_request
+def reset_db_counter():
+    db.reset_query_count()
+
+@app.after_request
+def add_db_counter(response):
+    if DB_QUERY_HEADER:
+        response.headers['X-DB-Queries'] = str(db.query_count())
+    return response
+
+def pool_connections():
+    stats = db.pool_stats() or {'in_use': 0, 'idle': 0}
+    return {('in_use',): stats['in_use'], ('idle',): stats['idle']}
+
+metrics.CallbackMetric('db_pool_connections', '連線池目前的連線數', ('state',), pool_connections)
+metrics.CallbackMetric('cache_hits_total', '快取命中次數（data 含超過 soft TTL 的舊資料）', ('cache',),
+                       lambda: {('data',): data_cache.hits + data_cache.stale_hits, ('cards',): cards_cache.hits},
+                       metric_type='counter')
+metrics.CallbackMetric('cache_misses_total', '快取未命中次數', ('cache',),
+                       lambda: {('data',): data_cache.misses, ('cards',): cards_cache.misses},
+                       metric_type='counter')
+metrics.CallbackMetric('cache_refresh_total', '背景更新快取的次數', ('result',),
+                       lambda: {('ok',): data_cache.refreshes, ('error',): data_cache.refresh_errors},
+                       metric_type='counter')
+
+metrics.CallbackMetric('db_breaker_open', '斷路器是否斷開 (1 = 斷開或試探中)', (),
+                       lambda: {(): 0 if db.breaker.state == 'closed' else 1})
+
+@app.errorhandler(db.Unavailable)
+def database_unavailable(e):
+    # 資料庫忙碌或斷路器斷開：馬上回 503 請用戶端稍後再試，不讓請求堆在 worker 裡等逾時
+    if request.endpoint in ('new_content', 'api_courses', 'api_news') or request.args.get('format') == 'json':
+        response = jsonify(error="系統忙碌中，請稍後再試")
+    else:
+        response = make_response(render_template("error.html.jinja2",error_message="系統忙碌中，請稍後再試"))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    response.cache_control.no_store = True
+    return response
+
+# 資料被匯入程式以外的方式修改時（手動、管理介面、課程的 SQL 檔），由網站在背景補做匯入程式會做的事：
+# 重新整理課程卡片檢視、替新增或修改過的資料斷詞。短時間內的多次異動等 CHANGE_TASK_DELAY 秒後只做一次
+CHANGE_TASK_DELAY = float(os.getenv('CHANGE_TASK_DELAY', '2'))
+_change_tasks = {}            # 工作名稱 -> 等待中的 threading.Timer
+_change_tasks_lock = threading.Lock()
+
+def on_course_changed(payload):
+    data_cache.expire(('version', '進修課程'))
+    # cards_refreshed 是 course_cards.refresh 整理完送出的通知，不必再整理
+    if payload != 'cards_refreshed':
+        schedule_change_task('search:進修課程', index_search, '進修課程')
+        schedule_change_task('cards', refresh_cards)
+
+def on_news_changed(payload):
+    data_cache.expire(('version', '最新訊息'))
+    schedule_change_task('search:最新訊息', index_search, '最新訊息')
+
+def schedule_change_task(name, func, *args):
+    with _change_tasks_lock:
+        if name in _change_tasks:
+            return
+        timer = threading.Timer(CHANGE_TASK_DELAY, run_change_task, (name, func) + args)
+        timer.daemon = True
+        _change_tasks[name] = timer
+        timer.start()
+
+def run_change_task(name, func, *args):
+    with _change_tasks_lock:
+        _change_tasks.pop(name, None)
+    try:
+        with db.get_conn() as conn:
+            with conn.cursor() as cur:
+                again = func(cur, *args)
+            conn.commit()
+    except Exception as e:
+        print("資料異動後的背景工作失敗", name)
+        print(e)
+        return
+    if again:
+        schedule_change_task(name, func, *args)
+
+def refresh_cards(cur):
+    # 每個 worker 都會收到通知，只有拿到 advisory lock 且檢視比課程舊的那一個會真的整理；
+    # 整理完會把資料版本加 1，以新版本號快取到的舊卡片就不會再被使用
+    # 回傳 True 表示別的 worker 正在整理，等一下再確認是否還需要
+    return course_cards.refresh(cur, wait=False, bump=True) is None
+
+def index_search(cur, table):
+    # 新增或文字被修改的資料斷詞；只寫「搜尋詞」不會觸發異動通知 (sql/異動通知.sql)
+    fulltext.index_pending(cur, table, skip_locked=True)
+    return False
+
+@app.errorhandler(errors.UndefinedTable)
+def schema_missing(e):
+    # 還沒套用 finished/sql 的設定檔（例如 sql/課程卡片.sql）：記下缺哪一個，給使用者明確的錯誤頁而不是不明的 500
+    print("資料表或檢視不存在，請執行 finished/sql 的設定檔")
+    print(e)
+    if request.endpoint in ('new_content', 'api_courses', 'api_news') or request.args.get('format') == 'json':
+        return jsonify(error="網站資料尚未建立完成"),500
+    return render_template("error.html.jinja2",error_message="網站資料尚未建立完成，請稍後再試"),500
+
+def with_cursor(func, *args):
+    # 快取的 loader 可能在背景執行緒執行，自己向連線池借連線
+    with db.get_conn() as conn, conn.cursor() as cur:
+        return func(cur, *args)
+
+def cached_version(table):
+    # (版本號, 更新時間)；資料版本表沒有這張表的列、或還沒套用 sql/異動通知.sql 時是 None
+    return data_cache.get(('version', table), lambda: with_cursor(conditional.table_version, table))
+
+def version_number(version):
+    return version[0] if version is not None else None
+
+def cached_kinds():
+    number = version_number(cached_version('進修課程'))
+    return data_cache.get(('kinds', number), lambda: with_cursor(load_kinds))
+
+def load_kinds(cur):
+    cur.execute(queries.COURSE_KINDS)
+    temps = cur.fetchall()
+    kinds = [kind[0] for kind in temps]
+    kinds.reverse()
+    return kinds
+
+def load_course_page(cur, kind, page, per_page):
+    cur.execute(queries.COURSE_PAGE, (kind, (page - 1) * per_page, per_page))
+    rows = cur.fetchall()
+    if rows:
+        total = rows[0][-1]
+    else:
+        # 頁碼超出範圍時拿不到類別筆數，另外用 count 補查
+        cur.execute(queries.COURSE_COUNT, (kind,))
+        total = cur.fetchone()[0]
+    items = [row[:-1] for row in rows]  # 去掉最後的總筆數欄位
+    return items, queries.total_pages(total, per_page)
+
+def load_news_count(cur):
+    cur.execute(queries.NEWS_COUNT)
+    return cur.fetchone()[0]
+
+def load_news_page(cur, limit, offset):
+    cur.execute(queries.NEWS_LIST, (limit, offset))
+    return cur.fetchall()
+
+def load_news_content(cur, news_id):
+    cur.execute(queries.NEWS_CONTENT, (news_id,))
+    return cur.fetchone()
+
+def warm_up(deadline=None, heartbeat=None):
+    # 給 warmup.py 在 worker 接受請求前呼叫：key 與 /classes、/new 第一頁用的相同，回傳預先載入的項目數
+    # 超過 deadline (time.monotonic()) 就停止；heartbeat 每載入一項呼叫一次
+    number = version_number(cached_version('進修課程'))
+    news_number = version_number(cached_version('最新訊息'))
+    steps = [(('news_count', news_number), lambda: with_cursor(load_news_count)),
+             (('news', 1, news_number), lambda: with_cursor(load_news_page, NEWS_PER_PAGE, 0))]
+    steps += [(('courses', kind, 1, number),
+               lambda kind=kind: with_cursor(load_course_page, kind, 1, COURSES_PER_PAGE))
+              for kind in cached_kinds()]
+    for key, loader in steps:
+        if heartbeat is not None:
+            heartbeat()
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        data_cache.get(key, loader)
+    return data_cache.stats()['size']
 
 @app.route("/")
 def index():
@@ -19,73 +227,236 @@ def classes():
     # 從 URL 查詢參數獲取課程類型，預設為 '一般課程'
     # 這與 classes.html.jinja2 中的 url_for('classes', kind=kind) 相對應
     course_types = request.args.get('kind', '一般課程', type=str)
-    conn = psycopg2.connect(conn_string)
-    with conn.cursor() as cur:
-        sql = """
-        SELECT DISTINCT "課程類別" FROM "進修課程";
-        """
-        cur.execute(sql)
-        temps = cur.fetchall()
-        kinds = [kind[0] for kind in temps]
-        kinds.reverse()
-
-        sql_course = """
-        SELECT
-            "課程名稱",
-            "群組",
-            "進修人數",
-            "進修時數",
-            "進修費用",
-            "上課時間",
-            "課程開始日期"
-        FROM
-            "進修課程"
-        WHERE
-            "課程類別" = %s;
-        """
-        cur.execute(sql_course, (course_types,))
-        course_data = cur.fetchall()
-        page = request.args.get('page', 1, type=int)
-        per_page = 6
-        total = len(course_data)
-        
-        # 修正分頁總數計算，避免在項目剛好是 per_page 的倍數時產生多餘頁面
-        total_pages = (total + per_page - 1) // per_page
-        if total_pages == 0:
-            total_pages = 1
-
-        start = (page - 1) * per_page
-        end = start + per_page
-        items = course_data[start:end]  # 取得該頁資料
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        page = 1
+    page = min(page, queries.PAGE_MAX)
+    per_page = COURSES_PER_PAGE
+    try:
+        # 先看資料版本，瀏覽器或 CDN 手上的版本還是最新的就直接回 304，不查詢也不渲染
+        # 版本、類別與課程都從 data_cache 取，只有快取沒有資料時才向連線池借連線查詢
+        version = cached_version('進修課程')
+        if version is not None:
+            etag, last_modified = conditional.validators(version)
+            if conditional.is_not_modified(etag, last_modified):
+                return conditional.not_modified_response(etag, last_modified)
+
+        kinds = cached_kinds()
+
+        # 卡片與分頁的 HTML 只跟 (類別, 頁碼, 資料版本) 有關，命中快取就不用查詢課程
+        cache_key = (course_types, page, version[0]) if version is not None else None
+        course_cards = cards_cache.get(cache_key) if cache_key is not None else None
+        if course_cards is None:
+            items, total_pages = data_cache.get(
+                ('courses', course_types, page, version_number(version)),
+                lambda: with_cursor(load_course_page, course_types, page, per_page))
+    except OperationalError as e:
+        print("連線失敗")
+        print(e)
+        return render_template("error.html.jinja2",error_message="資料庫錯誤"),500
+
+    if course_cards is None:
+        course_cards = Markup(render_template("partials/course_cards.html.jinja2",
+                                              course_data=items,
+                                              page=page,
+                                              total_pages=total_pages,
+                                              current_kind=course_types))
+        if cache_key is not None:
+            cards_cache.put(cache_key, course_cards)
 
     # 將 current_kind 傳遞給模板，用於標記當前選中的課程類型
-    return render_template("classes.html.jinja2",
+    response = make_response(render_template("classes.html.jinja2",
+                                             kinds=kinds,
+                                             course_cards=course_cards,
+                                             current_kind=course_types))
+    if version is not None:
+        conditional.set_validators(response, etag, last_modified)
+    return response
+
+@app.route("/classes/search")
+def classes_search():
+    # 分面搜尋：kind、group、month (YYYY-MM)、fee、hours 可以任意組合；format=json 回傳 JSON
+    filters = search.parse_filters(request.args)
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        page = 1
+    page = min(page, queries.PAGE_MAX)
+    try:
+        # 先取類別（可能要另外借連線），避免同一個請求同時佔用兩條連線
+        kinds = cached_kinds()
+        with db.get_conn() as conn, conn.cursor() as cur:
+            result = search.faceted_search(cur, filters, page, per_page=6)
+    except OperationalError as e:
+        print("連線失敗")
+        print(e)
+        if request.args.get('format') == 'json':
+            return jsonify(error="資料庫錯誤"),500
+        return render_template("error.html.jinja2",error_message="資料庫錯誤"),500
+
+    if request.args.get('format') == 'json':
+        return jsonify(result)
+
+    course_data = [[course[name] for name in search.CARD_FIELDS] for course in result['results']]
+    return render_template("classes_search.html.jinja2",
                            kinds=kinds,
-                           course_data=items,
+                           course_data=course_data,
+                           facets=result['facets'],
+                           filters=filters,
+                           total=result['total'],
+                           page=page,
+                           total_pages=result['total_pages'],
+                           facet_params=search.FACET_PARAMS,
+                           toggle=search.toggle,
+                           pagination_endpoint='classes_search',
+                           pagination_args=filters)
+
+@app.route("/search")
+def site_search():
+    # 全文檢索課程與最新訊息：沒有指定 type 時兩邊各列前幾筆，指定 type 時只查那一邊並分頁
+    q = request.args.get('q', '', type=str).strip()
+    section = request.args.get('type', '', type=str)
+    if section not in ('course', 'news'):
+        section = ''
+    page = request.args.get('page', 1, type=int)
+    if page < 1 or not section:
+        page = 1
+    page = min(page, queries.PAGE_MAX)
+    per_page = 10 if section else 5
+
+    terms = fulltext.query_terms(q)
+    results = {}
+    if terms:
+        tsquery = fulltext.to_tsquery(terms)
+        try:
+            with db.get_conn() as conn, conn.cursor() as cur:
+                for name, sql in (('course', queries.COURSE_SEARCH), ('news', queries.NEWS_SEARCH)):
+                    if section in ('', name):
+                        cur.execute(sql, (tsquery, per_page, (page - 1) * per_page))
+                        rows = cur.fetchall()
+                        # 頁碼超出範圍時拿不到總數，只顯示沒有結果
+                        total = rows[0][-1] if rows else 0
+                        results[name] = {'rows': [row[:-1] for row in rows],
+                                         'total': total,
+                                         'total_pages': queries.total_pages(total, per_page)}
+        except OperationalError as e:
+            print("連線失敗")
+            print(e)
+            return render_template("error.html.jinja2",error_message="資料庫錯誤"),500
+
+    return render_template("search.html.jinja2",
+                           q=q,
+                           terms=terms,
+                           section=section,
                            page=page,
-                           total_pages=total_pages,
-                           current_kind=course_types)
+                           results=results,
+                           highlight=fulltext.highlight)
+
+# /new 串流時 server-side cursor 每次向資料庫取回的筆數，worker 記憶體只放得下這一批
+NEWS_STREAM_BATCH = int(os.getenv('NEWS_STREAM_BATCH', '200'))
+
+def news_stream(limit, offset):
+    # 在回應送出的過程中才逐批讀取；連線要等整頁送完（或用戶端斷線）才歸還
+    with db.get_conn() as conn:
+        # 有名稱的 cursor 是 server-side cursor，結果留在資料庫，迭代時每次 FETCH 一批
+        with conn.cursor(name='news_stream') as cur:
+            cur.itersize = NEWS_STREAM_BATCH
+            cur.execute(queries.NEWS_LIST, (limit, offset))
+            yield
+            yield from cur
+
+def open_news_stream(limit, offset):
+    # 先借連線並送出查詢（停在 news_stream 的第一個 yield），連不上時還來得及回錯誤頁
+    rows = news_stream(limit, offset)
+    next(rows)
+    return log_stream_errors(rows)
+
+def log_stream_errors(rows):
+    try:
+        yield from rows
+    except OperationalError as e:
+        # 標頭已經送出，沒辦法再改成錯誤頁，只能記錄後結束列表；回應是 no-store，不完整的頁面不會被快取
+        print("連線失敗")
+        print(e)
 
 @app.route("/new")
 def new():
+    # 列表只帶 id、主題、上版日期，內容等使用者展開時再由 /new/<id> 載入
+    # all=1 列出全部訊息；頁首與前面的訊息先送到瀏覽器，後面的邊讀邊送
+    show_all = request.args.get('all') == '1'
+    page = request.args.get('page', 1, type=int)
+    if page < 1 or show_all:
+        page = 1
+    per_page = NEWS_PER_PAGE
     try:
-        conn = psycopg2.connect(conn_string)
-        with conn.cursor() as cur:
-            sql = """SELECT * FROM public.最新訊息
-                     ORDER BY 上版日期 desc"""
-            cur.execute(sql)
-        # 取得所有資料
-            rows = cur.fetchall()
-            
-        
+        version = cached_version('最新訊息')
+        # 串流的回應不帶 ETag：送到一半中斷的頁面不能之後再被 304 確認
+        if version is not None and not show_all:
+            etag, last_modified = conditional.validators(version)
+            if conditional.is_not_modified(etag, last_modified):
+                return conditional.not_modified_response(etag, last_modified)
+
+        number = version_number(version)
+        total = data_cache.get(('news_count', number), lambda: with_cursor(load_news_count))
+        total_pages = queries.total_pages(total, per_page)
+        # 超過最後一頁就顯示最後一頁，太大的頁碼也不會讓 OFFSET 溢位
+        page = min(page, total_pages)
+        if show_all:
+            rows = open_news_stream(None, 0)
+        else:
+            rows = data_cache.get(('news', page, number),
+                                  lambda: with_cursor(load_news_page, per_page, (page - 1) * per_page))
     except OperationalError as e:
         print("連線失敗")
         print(e)
         return render_template("error.html.jinja2",error_message="資料庫錯誤"),500
+    except db.Unavailable:
+        # 交給 database_unavailable 回 503
+        raise
     except:
         return render_template("error.html.jinja2",error_message="不知名錯誤"),500
-    conn.close()
-    return render_template("new.html.jinja2",rows=rows)
+
+    context = dict(page=page,
+                   per_page=per_page,
+                   total=total,
+                   show_all=show_all,
+                   total_pages=total_pages)
+    if show_all:
+        response = Response(stream_template("new.html.jinja2", rows=rows, **context))
+        # 請 nginx 之類的反向代理不要緩衝，收到一段就轉送一段
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.cache_control.no_store = True
+    else:
+        # 一頁只有幾筆而且已經在快取裡，直接整頁渲染（也能被壓縮）
+        response = make_response(render_template("new.html.jinja2", rows=rows, **context))
+        if version is not None:
+            conditional.set_validators(response, etag, last_modified)
+    return response
+
+@app.route("/new/<int:news_id>")
+def new_content(news_id):
+    # 單則訊息的內容，給 news.js 在展開 accordion 時載入
+    if news_id > queries.NEWS_ID_MAX:
+        return jsonify(error="找不到這則訊息"),404
+    try:
+        version = cached_version('最新訊息')
+        if version is not None:
+            etag, last_modified = conditional.validators(version, news_id)
+            if conditional.is_not_modified(etag, last_modified):
+                return conditional.not_modified_response(etag, last_modified)
+
+        row = data_cache.get(('news_content', news_id, version_number(version)),
+                             lambda: with_cursor(load_news_content, news_id))
+    except OperationalError as e:
+        print("連線失敗")
+        print(e)
+        return jsonify(error="資料庫錯誤"),500
+    if row is None:
+        return jsonify(error="找不到這則訊息"),404
+
+    response = jsonify(id=row[0], 內容=row[1])
+    if version is not None:
+        conditional.set_validators(response, etag, last_modified)
+    return response
 
 @app.route("/traffic")
 def traffic():
@@ -94,3 +465,16 @@ def traffic():
 @app.route("/contact")
 def contact():
     return render_template("contact.html.jinja2")
+
+@app.route("/pool_stats")
+def pool_stats():
+    # 連線池與快取使用狀況：in_use / idle / 等待時間，用來依 gunicorn worker 數調整大小
+    return jsonify(pool=db.pool_stats(),
+                   breaker=db.breaker.stats(),
+                   data_cache=data_cache.stats(),
+                   cards_cache=cards_cache.stats())
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus 文字格式：路由、查詢、模板渲染的時間直方圖與連線池狀態
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
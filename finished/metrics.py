@@ -0,0 +1,145 @@
+# 簡易的 Prometheus 指標：直方圖、計數器與抓取時才取值的回呼指標，以文字格式輸出給 /metrics
+# 數值存在各個 worker 行程裡，Prometheus 抓取時會分別看到每個 worker 的資料
+import bisect
+import threading
+import time
+
+from flask import g, request
+from flask import before_render_template, template_rendered
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}             # label_values -> [各區間次數..., 總和, 次數]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(label_values)
+            if data is None:
+                data = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = [(labels, list(data)) for labels, data in self._values.items()]
+        for label_values, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), data):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket{_format_labels(self.labels, label_values, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labels, label_values)} {data[-2]}'
+            yield f'{self.name}_count{_format_labels(self.labels, label_values)} {data[-1]}'
+
+
+class CallbackMetric:
+    # 抓取時才呼叫 func 取值，func 回傳 {label_values: 數值}
+    # 已經在別處累計好的次數 (例如快取命中數) 用 metric_type='counter'
+    def __init__(self, name, help_text, labels, func, metric_type='gauge'):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.func = func
+        self.metric_type = metric_type
+        REGISTRY.append(self)
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} {self.metric_type}'
+        for label_values, value in self.func().items():
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {value}'
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+# ---- 網站用到的指標 ----
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', '每個路由的處理時間', ('route', 'method'))
+REQUESTS = Counter('http_requests_total', '每個路由的請求數', ('route', 'method', 'status'))
+RENDER_SECONDS = Histogram('template_render_seconds', '模板渲染時間', ('template',))
+QUERY_SECONDS = Histogram('db_query_duration_seconds', '查詢執行時間（含傳輸結果）', ('query',))
+ROWS_FETCHED = Counter('db_rows_fetched_total', '查詢取回的資料列數', ('query',))
+POOL_WAIT_SECONDS = Histogram('db_pool_wait_seconds', '向連線池借連線的等待時間（含建立新連線）')
+DB_REJECTED = Counter('db_rejected_total', '因資料庫忙碌而直接回 503 的次數', ('reason',))
+# 命中率 = br + gzip / 全部；省下的位元組 = original - compressed
+COMPRESSION_RESPONSES = Counter('http_compression_responses_total', '可壓縮回應的處理結果', ('result',))
+COMPRESSION_BYTES = Counter('http_compression_bytes_total', '壓縮前後的回應大小', ('stage',))
+
+
+def init_app(app):
+    # 記錄每個請求的總時間，以及其中花在模板渲染的時間
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method)
+            REQUESTS.inc(1, route, request.method, str(response.status_code))
+        return response
+
+    def _before_render(sender, template, context, **extra):
+        g.setdefault('_render_starts', {})[template.name] = time.perf_counter()
+
+    def _after_render(sender, template, context, **extra):
+        start = g.get('_render_starts', {}).pop(template.name, None)
+        if start is not None:
+            RENDER_SECONDS.observe(time.perf_counter() - start, template.name)
+
+    before_render_template.connect(_before_render, app, weak=False)
+    template_rendered.connect(_after_render, app, weak=False)
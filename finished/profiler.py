@@ -0,0 +1,198 @@
+# 正式環境用的取樣式效能分析（預設關閉）：
+# - PROFILE_SAMPLE_RATE=0.01 表示隨機分析 1% 的請求；
+#   設定 PROFILE_TOKEN 後，帶 X-Profile: <token> 標頭的請求一定會分析
+# - 背景執行緒每 PROFILE_INTERVAL_MS 毫秒記錄一次被分析請求的呼叫堆疊，依路由累計，不修改被分析的程式
+# - GET /profile?format=collapsed 下載 flamegraph.pl / speedscope 都讀得懂的 collapsed stack，
+#   format=speedscope 下載 speedscope 的 JSON；reset=1 下載後清除（同樣要帶 X-Profile 標頭）
+# 堆疊裡 InstrumentedCursor.execute 底下是等資料庫的時間，templates/ 的框是模板渲染，其餘是 Python 本身
+# 資料存在各個 worker 行程裡，/profile 拿到的是處理這個請求的 worker 的資料
+# 以作業系統執行緒取樣，sync / gthread worker 才有資料；gevent 的協程看不到
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import Response, abort, g, request
+
+SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+TOKEN = os.getenv('PROFILE_TOKEN', '')
+INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000
+# 每個路由最多保留幾種不同的堆疊，避免記憶體無限增長
+MAX_STACKS = int(os.getenv('PROFILE_MAX_STACKS', '5000'))
+MAX_DEPTH = 128
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Sampler:
+    def __init__(self, interval=INTERVAL, max_stacks=MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self._active = {}             # 執行緒 id -> 路由
+        self._stacks = {}             # 路由 -> Counter((框, ...) -> 取樣次數)
+        self._dropped = Counter()     # 路由 -> 超過 max_stacks 而沒有記錄的取樣數
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pid = None
+        self.requests = 0
+
+    def start(self, route):
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 之後執行緒不會跟過來，每個 worker 第一次需要時自己啟動
+                self._pid = os.getpid()
+                self._active.clear()
+                threading.Thread(target=self._loop, name="profiler", daemon=True).start()
+            self._active[threading.get_ident()] = route
+            self.requests += 1
+            self._wakeup.notify()
+
+    def stop(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                # 沒有被分析的請求時就睡著，不佔 CPU
+                while not self._active:
+                    self._wakeup.wait()
+                active = dict(self._active)
+            frames = sys._current_frames()
+            samples = [(route, _stack(frames[ident])) for ident, route in active.items() if ident in frames]
+            with self._lock:
+                for route, stack in samples:
+                    stacks = self._stacks.setdefault(route, Counter())
+                    if stack in stacks or len(stacks) < self.max_stacks:
+                        stacks[stack] += 1
+                    else:
+                        self._dropped[route] += 1
+            time.sleep(self.interval)
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            stacks = {route: Counter(counts) for route, counts in self._stacks.items()}
+            if reset:
+                self._stacks.clear()
+                self._dropped.clear()
+        return stacks
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'active': len(self._active),
+                'samples': {route: sum(counts.values()) for route, counts in self._stacks.items()},
+                'dropped': dict(self._dropped),
+            }
+
+
+def _frame_name(code):
+    path = code.co_filename
+    if path.startswith(APP_DIR):
+        path = os.path.relpath(path, APP_DIR)
+    else:
+        path = os.path.basename(path)
+    return (code.co_name, path, code.co_firstlineno)
+
+
+def _stack(frame):
+    # 由外往內 (root 在前)
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+def collapsed(stacks):
+    # 每行一個堆疊：「路由;函式 (檔案:行);... 次數」
+    lines = []
+    for route, counts in sorted(stacks.items()):
+        for stack, count in counts.most_common():
+            names = [route] + [f'{name} ({path}:{line})' for name, path, line in stack]
+            lines.append(';'.join(name.replace(';', ':') for name in names) + f' {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def speedscope(stacks, interval=INTERVAL):
+    # https://www.speedscope.app/file-format-schema.json，每個路由一個 sampled profile
+    frames = []
+    index = {}
+    profiles = []
+    unit = interval * 1000
+    for route, counts in sorted(stacks.items()):
+        samples = []
+        weights = []
+        for stack, count in counts.most_common():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    name, path, line = frame
+                    frames.append({'name': name, 'file': path, 'line': line})
+                ids.append(index[frame])
+            samples.append(ids)
+            weights.append(count * unit)
+        profiles.append({
+            'type': 'sampled',
+            'name': route,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        })
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': profiles,
+        'name': f'PythonWeb worker {os.getpid()}',
+        'exporter': 'PythonWeb profiler.py',
+    }
+
+
+sampler = Sampler()
+
+
+def _authorized():
+    header = request.headers.get('X-Profile', '')
+    return bool(TOKEN) and hmac.compare_digest(header.encode('utf-8'), TOKEN.encode('utf-8'))
+
+
+def init_app(app):
+    @app.before_request
+    def _start_profile():
+        if request.endpoint in (None, 'profile', 'static', 'hashed_static'):
+            return
+        if _authorized() or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE):
+            g._profiled = True
+            sampler.start(f'{request.method} {request.url_rule.rule}')
+
+    @app.teardown_request
+    def _stop_profile(exc):
+        if g.pop('_profiled', False):
+            sampler.stop()
+
+    @app.route('/profile')
+    def profile():
+        if not _authorized():
+            abort(404)
+        stacks = sampler.snapshot(reset=request.args.get('reset') == '1')
+        if request.args.get('format') == 'speedscope':
+            body = json.dumps(speedscope(stacks), ensure_ascii=False)
+            response = Response(body, mimetype='application/json')
+            filename = f'profile-{os.getpid()}.speedscope.json'
+        elif request.args.get('format') == 'collapsed':
+            response = Response(collapsed(stacks), mimetype='text/plain')
+            filename = f'profile-{os.getpid()}.collapsed.txt'
+        else:
+            return sampler.stats()
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.cache_control.no_store = True
+        return response
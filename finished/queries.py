@@ -0,0 +1,116 @@
+# 網站用到的 SQL 集中放在這裡，同步版 (index.py) 與非同步版 (async_index.py) 共用
+# psycopg2 與 psycopg 3 的參數都用 %s，所以同一段 SQL 兩邊都能執行
+
+TABLE_VERSION = 'SELECT "版本", "更新時間" FROM public."資料版本" WHERE "表名" = %s;'
+
+# 課程列表都從窄的 課程卡片 實體化檢視讀取 (sql/課程卡片.sql)，不碰寬的 進修課程
+COURSE_KINDS = """
+SELECT DISTINCT "課程類別" FROM "課程卡片";
+"""
+
+# 序號是類別內依開始日期排好的順序，用序號範圍取這一頁，不必 OFFSET 掃過前面的資料；
+# 類別筆數在檢視裡已經算好，每一列都帶著
+# 參數：(類別, 略過的筆數, 每頁筆數)
+COURSE_PAGE = """
+SELECT
+    "課程名稱",
+    "群組",
+    "進修人數",
+    "進修時數",
+    "進修費用",
+    "上課時間",
+    "課程開始日期",
+    "類別筆數"
+FROM
+    "課程卡片"
+WHERE
+    "課程類別" = %s AND "序號" > %s
+ORDER BY
+    "序號"
+LIMIT %s;
+"""
+
+COURSE_COUNT = 'SELECT count(*) FROM "課程卡片" WHERE "課程類別" = %s;'
+
+NEWS_COUNT = "SELECT count(*) FROM public.最新訊息"
+
+# /new 串流輸出的列表：不帶總筆數（視窗函式要先算完全部資料才會送出第一列），
+# 總筆數另外用 NEWS_COUNT 查；LIMIT NULL 等於不限筆數
+NEWS_LIST = """SELECT id, 主題, 上版日期
+FROM public.最新訊息
+ORDER BY 上版日期 desc, id desc
+LIMIT %s OFFSET %s"""
+
+# id 是 smallint；參數轉成 bigint，預備陳述式才不會把參數型別推成 smallint，超出 smallint 的 id 一樣只是查無資料
+# 路由會先擋掉超過 NEWS_ID_MAX 的 id，避免連 bigint 都放不下
+NEWS_CONTENT = "SELECT id, 內容 FROM public.最新訊息 WHERE id = CAST(%s AS bigint)"
+NEWS_ID_MAX = 32767
+
+# 全文檢索 (fulltext.py)：參數是 tsquery 文字，依相關度排序，總筆數一樣用視窗函式帶回
+COURSE_SEARCH = """
+SELECT
+    "課程名稱",
+    "課程類別",
+    "群組",
+    "上課時間",
+    "課程開始日期",
+    "課程內容",
+    count(*) OVER() AS "總筆數"
+FROM
+    "進修課程", CAST(%s AS tsquery) AS q
+WHERE
+    "搜尋詞" @@ q
+ORDER BY
+    ts_rank_cd("搜尋詞", q) DESC, "課程開始日期", "課程名稱"
+LIMIT %s OFFSET %s;
+"""
+
+NEWS_SEARCH = """SELECT id, 主題, 上版日期, 內容, count(*) OVER() AS 總筆數
+FROM public.最新訊息, CAST(%s AS tsquery) AS q
+WHERE 搜尋詞 @@ q
+ORDER BY ts_rank_cd(搜尋詞, q) DESC, 上版日期 desc, id desc
+LIMIT %s OFFSET %s"""
+
+
+# 頁碼上限：COURSE_PAGE 預備後 OFFSET 參數是 bigint，太大的頁碼會讓 (頁碼 - 1) * 每頁筆數 溢位；
+# 這麼後面的頁本來就沒有資料，路由先把頁碼限制在這裡
+PAGE_MAX = 100000
+
+
+def total_pages(total, per_page):
+    # 修正分頁總數計算，避免在項目剛好是 per_page 的倍數時產生多餘頁面
+    pages = (total + per_page - 1) // per_page
+    return pages if pages > 0 else 1
+
+
+# SQL 內容 -> 常數名稱，/metrics 用這個名稱當查詢的標籤，避免把整段 SQL 放進標籤
+_NAMES = {sql: name for name, sql in list(globals().items())
+          if name.isupper() and isinstance(sql, str)}
+
+# /classes 與 /new 每個請求都會執行的查詢：db.InstrumentedCursor 在每條連線第一次用到時 PREPARE，
+# 之後只送 EXECUTE，PostgreSQL 不必每次重新解析與規劃
+PREPARED = ['TABLE_VERSION', 'COURSE_KINDS', 'COURSE_PAGE', 'COURSE_COUNT',
+            'NEWS_COUNT', 'NEWS_LIST', 'NEWS_CONTENT']
+
+
+def prepare_sql(name):
+    # %s 依序換成 $1、$2 ...
+    parts = globals()[name].strip().rstrip(';').split('%s')
+    body = parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], 1))
+    return f'PREPARE {name.lower()} AS {body}'
+
+
+def execute_sql(name):
+    count = globals()[name].count('%s')
+    args = f"({', '.join(['%s'] * count)})" if count else ''
+    return f'EXECUTE {name.lower()}{args}'
+
+
+def name_of(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    name = _NAMES.get(sql)
+    if name is None and sql.startswith('/* '):
+        # 動態組成的 SQL 以 /* 名稱 */ 開頭標示
+        name = sql[3:sql.find(' */')]
+    return name or 'other'
@@ -0,0 +1,180 @@
+# 課程的分面搜尋：課程類別、群組、開課月份、費用與時數級距
+# 篩選條件只把有用到的條件組進 WHERE（值一律用參數傳入），
+# 這一頁的課程與每個分面的筆數用 GROUPING SETS 在同一個查詢裡算完，只要一次來回
+import re
+from datetime import date
+
+import queries
+
+# 卡片顯示的欄位，順序與 partials/course_cards.html.jinja2 的 course[0] ~ course[6] 相同
+CARD_FIELDS = ['課程名稱', '群組', '進修人數', '進修時數', '進修費用', '上課時間', '課程開始日期']
+
+# 級距採「下限 <= 值 < 上限」，None 表示沒有限制
+FEE_BUCKETS = [
+    ('未滿1000元', None, 1000),
+    ('1000~1499元', 1000, 1500),
+    ('1500~1999元', 1500, 2000),
+    ('2000元以上', 2000, None),
+]
+HOURS_BUCKETS = [
+    ('未滿24小時', None, 24),
+    ('24~47小時', 24, 48),
+    ('48~95小時', 48, 96),
+    ('96小時以上', 96, None),
+]
+
+FACETS = ['群組', '月份', '費用', '時數']
+# 分面名稱對應的 URL 參數
+FACET_PARAMS = {'群組': 'group', '月份': 'month', '費用': 'fee', '時數': 'hours'}
+
+MONTH_PATTERN = re.compile(r'^(\d{4})-(\d{2})$')
+
+
+def _quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _bucket_case(column, buckets):
+    # 級距是程式內固定的常數，直接組成 CASE 運算式
+    parts = []
+    for label, low, high in buckets:
+        conditions = []
+        if low is not None:
+            conditions.append(f'"{column}" >= {low}')
+        if high is not None:
+            conditions.append(f'"{column}" < {high}')
+        parts.append(f"WHEN {' AND '.join(conditions)} THEN {_quote(label)}")
+    return 'CASE ' + ' '.join(parts) + ' END'
+
+
+def _bucket_range(buckets, label):
+    for name, low, high in buckets:
+        if name == label:
+            return low, high
+    return None
+
+
+def parse_filters(args):
+    # 從 URL 參數取出篩選條件，不認得的值直接忽略
+    filters = {}
+    for name in ('kind', 'group'):
+        value = args.get(name, '').strip()
+        if value:
+            filters[name] = value
+    month = MONTH_PATTERN.match(args.get('month', ''))
+    if month:
+        year, number = int(month.group(1)), int(month.group(2))
+        # date 的年份是 1~9999；9999-12 的下個月 (月份的結束日) 也超出範圍
+        if 1 <= year and 1 <= number <= 12 and (year, number) < (9999, 12):
+            filters['month'] = month.group(0)
+    if _bucket_range(FEE_BUCKETS, args.get('fee')):
+        filters['fee'] = args.get('fee')
+    if _bucket_range(HOURS_BUCKETS, args.get('hours')):
+        filters['hours'] = args.get('hours')
+    return filters
+
+
+def toggle(filters, param, value):
+    # 給模板產生分面連結：已選的值再點一次就取消，否則換成這個值；換條件時回到第一頁
+    new_filters = dict(filters)
+    if new_filters.get(param) == value:
+        new_filters.pop(param)
+    else:
+        new_filters[param] = value
+    return new_filters
+
+
+def where_clause(filters):
+    # 回傳 (WHERE 條件, 具名參數)；api.py 的課程列表也用同一套篩選條件
+    conditions = []
+    params = {}
+    if 'kind' in filters:
+        conditions.append('"課程類別" = %(kind)s')
+        params['kind'] = filters['kind']
+    if 'group' in filters:
+        conditions.append('"群組" = %(group)s')
+        params['group'] = filters['group']
+    if 'month' in filters:
+        year, month = map(int, filters['month'].split('-'))
+        params['month_start'] = date(year, month, 1)
+        params['month_end'] = date(year + month // 12, month % 12 + 1, 1)
+        conditions.append('"開始日" >= %(month_start)s AND "開始日" < %(month_end)s')
+    for name, column, buckets in (('fee', '費用', FEE_BUCKETS), ('hours', '時數', HOURS_BUCKETS)):
+        if name in filters:
+            low, high = _bucket_range(buckets, filters[name])
+            if low is not None:
+                conditions.append(f'"{column}" >= %({name}_low)s')
+                params[f'{name}_low'] = low
+            if high is not None:
+                conditions.append(f'"{column}" < %({name}_high)s')
+                params[f'{name}_high'] = high
+    return ' AND '.join(conditions) or 'TRUE', params
+
+
+def facet_query(filters, page=1, per_page=6):
+    # 回傳 (sql, params)；同步版與非同步版 (async_index.py) 共用
+    where, params = where_clause(filters)
+    params['limit'] = per_page
+    params['offset'] = (page - 1) * per_page
+    card_columns = ', '.join(f'"{name}"' for name in CARD_FIELDS)
+    # 開頭的註解是給 /metrics 用的查詢名稱
+    sql = f"""/* COURSE_FACETS */
+    WITH 篩選 AS (
+        SELECT {card_columns}, "開始日",
+               to_char("開始日", 'YYYY-MM') AS "月份",
+               {_bucket_case('費用', FEE_BUCKETS)} AS "費用級距",
+               {_bucket_case('時數', HOURS_BUCKETS)} AS "時數級距"
+        FROM "進修課程"
+        WHERE {where}
+    ), 分面 AS (
+        SELECT
+            CASE WHEN GROUPING("群組") = 0 THEN '群組'
+                 WHEN GROUPING("月份") = 0 THEN '月份'
+                 WHEN GROUPING("費用級距") = 0 THEN '費用'
+                 WHEN GROUPING("時數級距") = 0 THEN '時數'
+                 ELSE '全部' END AS "分面",
+            coalesce("群組", "月份", "費用級距", "時數級距") AS "值",
+            count(*) AS "筆數"
+        FROM 篩選
+        GROUP BY GROUPING SETS (("群組"), ("月份"), ("費用級距"), ("時數級距"), ())
+    )
+    SELECT
+        (SELECT coalesce(json_agg(p), '[]')
+         FROM (SELECT {card_columns} FROM 篩選
+               ORDER BY "開始日" NULLS LAST, "課程名稱"
+               LIMIT %(limit)s OFFSET %(offset)s) p) AS "結果",
+        (SELECT coalesce(json_agg(f ORDER BY f."分面", f."值"), '[]')
+         FROM 分面 f) AS "分面";
+    """
+    return sql, params
+
+
+def facet_result(row, filters, page=1, per_page=6):
+    # row 是 facet_query() 查回來的那一列：(這一頁的課程, 各分面筆數)
+    results, facet_rows = row
+    total = 0
+    facets = {name: [] for name in FACETS}
+    for item in facet_rows:
+        if item['分面'] == '全部':
+            total = item['筆數']
+        elif item['值'] is not None:
+            facets[item['分面']].append({'值': item['值'], '筆數': item['筆數']})
+    # 級距依定義的順序排列，而不是字串順序
+    for name, buckets in (('費用', FEE_BUCKETS), ('時數', HOURS_BUCKETS)):
+        order = {label: i for i, (label, _, _) in enumerate(buckets)}
+        facets[name].sort(key=lambda item: order.get(item['值'], len(order)))
+
+    return {
+        'results': results,
+        'facets': facets,
+        'total': total,
+        'page': page,
+        'total_pages': queries.total_pages(total, per_page),
+        'filters': filters,
+    }
+
+
+def faceted_search(cur, filters, page=1, per_page=6):
+    sql, params = facet_query(filters, page, per_page)
+    cur.execute(sql, params)
+    return facet_result(cur.fetchone(), filters, page, per_page)
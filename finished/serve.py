@@ -0,0 +1,71 @@
+# 正式環境的啟動與平順重新載入（設定在 gunicorn.conf.py）
+#
+#   python serve.py            # 啟動 gunicorn
+#   python serve.py reload     # HUP：重新讀取設定，逐一換掉 worker；preload 時不會載入新的程式碼
+#   python serve.py upgrade    # 部署新程式碼：USR2 啟動新的 master，就緒後讓舊的 master 做完手上的請求再結束
+#   python serve.py stop       # TERM：等請求處理完再關閉
+import argparse
+import os
+import runpy
+import signal
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG = os.path.join(APP_DIR, 'gunicorn.conf.py')
+# 新的 master 啟動後，等它的 worker 就緒的秒數
+UPGRADE_WAIT = float(os.getenv('GUNICORN_UPGRADE_WAIT', '5'))
+
+
+def read_pid(path):
+    with open(path) as f:
+        return int(f.read().strip())
+
+
+def start():
+    os.chdir(APP_DIR)
+    os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', CONFIG, 'index:app'])
+
+
+def upgrade(pidfile):
+    old = read_pid(pidfile)
+    os.kill(old, signal.SIGUSR2)
+    # 新的 master 會寫入新的 pidfile，舊的改名為 .oldbin
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            new = read_pid(pidfile)
+        except (OSError, ValueError):
+            new = None
+        if new is not None and new != old:
+            break
+        time.sleep(0.5)
+    else:
+        print("新的 master 沒有啟動，舊的繼續服務")
+        sys.exit(1)
+    time.sleep(UPGRADE_WAIT)
+    os.kill(old, signal.SIGTERM)
+    print(f"已由 master {new} 接手，舊的 master {old} 處理完請求後結束")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="啟動或平順重新載入 gunicorn")
+    parser.add_argument('command', nargs='?', default='start', choices=['start', 'reload', 'upgrade', 'stop'])
+    args = parser.parse_args()
+
+    if args.command == 'start':
+        start()
+    pidfile = runpy.run_path(CONFIG)['pidfile']
+    try:
+        if args.command == 'upgrade':
+            upgrade(pidfile)
+        else:
+            os.kill(read_pid(pidfile), signal.SIGHUP if args.command == 'reload' else signal.SIGTERM)
+    except (OSError, ValueError) as e:
+        print(f"找不到執行中的 gunicorn ({pidfile})")
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
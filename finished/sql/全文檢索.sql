@@ -0,0 +1,38 @@
+-- 中文全文檢索：PostgreSQL 內建的斷詞器不會切中文，改由 fulltext.py 用 jieba 斷詞後
+-- 把詞存進「搜尋詞」欄位，再用 GIN 索引查詢，不必 LIKE '%...%' 掃整張表
+-- 欄位是 NULL 表示還沒斷詞（新增或文字被修改過）：匯入程式會在同一個交易裡補上，
+-- 其他方式的寫入由網站收到 course_changed / news_changed 通知後在背景補上 (index.py)；
+-- 網站沒有在執行（或 DB_LISTEN=0）時請執行 python fulltext.py
+
+ALTER TABLE public."進修課程" ADD COLUMN IF NOT EXISTS "搜尋詞" tsvector;
+ALTER TABLE public.最新訊息 ADD COLUMN IF NOT EXISTS 搜尋詞 tsvector;
+
+CREATE INDEX IF NOT EXISTS 進修課程_搜尋詞_idx
+	ON public."進修課程" USING gin ("搜尋詞");
+CREATE INDEX IF NOT EXISTS 最新訊息_搜尋詞_idx
+	ON public.最新訊息 USING gin (搜尋詞);
+
+-- 被搜尋的文字改變時清掉舊的斷詞結果，避免搜尋到過時的內容
+CREATE OR REPLACE FUNCTION public.清除搜尋詞() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	NEW."搜尋詞" = NULL;
+	RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS 進修課程_清除搜尋詞 ON public."進修課程";
+CREATE TRIGGER 進修課程_清除搜尋詞
+	BEFORE UPDATE OF "課程名稱", "課程內容", "就業方向" ON public."進修課程"
+	FOR EACH ROW
+	WHEN (OLD."課程名稱" IS DISTINCT FROM NEW."課程名稱"
+		OR OLD."課程內容" IS DISTINCT FROM NEW."課程內容"
+		OR OLD."就業方向" IS DISTINCT FROM NEW."就業方向")
+	EXECUTE FUNCTION public.清除搜尋詞();
+
+DROP TRIGGER IF EXISTS 最新訊息_清除搜尋詞 ON public.最新訊息;
+CREATE TRIGGER 最新訊息_清除搜尋詞
+	BEFORE UPDATE OF 主題, 內容 ON public.最新訊息
+	FOR EACH ROW
+	WHEN (OLD.主題 IS DISTINCT FROM NEW.主題 OR OLD.內容 IS DISTINCT FROM NEW.內容)
+	EXECUTE FUNCTION public.清除搜尋詞();
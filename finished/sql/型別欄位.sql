@@ -0,0 +1,56 @@
+-- 進修課程的文字欄位（"25人"、"64小時"、"1400元"、民國日期 "114.07.08"、"114.05.16 10:00"）
+-- 另外存成數字與時間欄位，才能在 SQL 裡排序、做範圍查詢並使用索引。
+-- 用 STORED 產生欄位：匯入程式或手動寫入時由資料庫自動解析，原本的顯示文字保持不變，
+-- 新增欄位時既有資料也會一併換算。
+
+-- 民國日期 (可帶時間) 轉 timestamp，格式不對或日期不存在時回傳 NULL
+CREATE OR REPLACE FUNCTION public.民國日期(t text) RETURNS timestamp
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+	m text[];
+BEGIN
+	m := regexp_match(t, '(\d{2,3})\.(\d{1,2})\.(\d{1,2})(?:\s+(\d{1,2}):(\d{2}))?');
+	IF m IS NULL THEN
+		RETURN NULL;
+	END IF;
+	RETURN make_timestamp(m[1]::int + 1911, m[2]::int, m[3]::int,
+	                      coalesce(m[4], '0')::int, coalesce(m[5], '0')::int, 0);
+EXCEPTION WHEN others THEN
+	RETURN NULL;
+END;
+$$;
+
+-- 取出文字中的第一個數字，例如 "1,400元" -> 1400、"64小時" -> 64
+CREATE OR REPLACE FUNCTION public.取數值(t text) RETURNS numeric
+LANGUAGE sql IMMUTABLE AS $$
+	SELECT replace((regexp_match(t, '\d[\d,]*(?:\.\d+)?'))[1], ',', '')::numeric
+$$;
+
+ALTER TABLE public."進修課程"
+	ADD COLUMN IF NOT EXISTS "人數" integer
+		GENERATED ALWAYS AS (public.取數值("進修人數")::integer) STORED,
+	ADD COLUMN IF NOT EXISTS "時數" numeric
+		GENERATED ALWAYS AS (public.取數值("進修時數")) STORED,
+	ADD COLUMN IF NOT EXISTS "費用" integer
+		GENERATED ALWAYS AS (CASE WHEN "進修費用" LIKE '%免費%' THEN 0
+		                          ELSE public.取數值("進修費用")::integer END) STORED,
+	ADD COLUMN IF NOT EXISTS "報名開始時間" timestamp
+		GENERATED ALWAYS AS (public.民國日期("報名開始日期")) STORED,
+	ADD COLUMN IF NOT EXISTS "報名結束時間" timestamp
+		GENERATED ALWAYS AS (public.民國日期("報名結束日期")) STORED,
+	ADD COLUMN IF NOT EXISTS "開始日" date
+		GENERATED ALWAYS AS (public.民國日期("課程開始日期")::date) STORED,
+	ADD COLUMN IF NOT EXISTS "結束日" date
+		GENERATED ALWAYS AS (public.民國日期("課程結束日期")::date) STORED;
+
+-- 例如「某群組、某日之後開課、費用 1500 元以下」：先用群組 + 開始日範圍掃索引，費用直接從索引過濾
+CREATE INDEX IF NOT EXISTS 進修課程_群組_開始日_idx
+	ON public."進修課程" ("群組", "開始日") INCLUDE ("費用");
+CREATE INDEX IF NOT EXISTS 進修課程_開始日_idx
+	ON public."進修課程" ("開始日");
+CREATE INDEX IF NOT EXISTS 進修課程_費用_idx
+	ON public."進修課程" ("費用");
+
+-- /classes/search 常見的組合：課程類別 + 群組 + 開課日，費用與時數直接從索引過濾
+CREATE INDEX IF NOT EXISTS 進修課程_類別_群組_開始日_idx
+	ON public."進修課程" ("課程類別", "群組", "開始日") INCLUDE ("費用", "時數");
@@ -0,0 +1,11 @@
+-- /classes 依課程類別篩選並依開始日期排序分頁，這個索引讓 LIMIT/OFFSET 不必排序整張表
+CREATE INDEX IF NOT EXISTS 進修課程_類別_開始日期_idx
+	ON public."進修課程" ("課程類別", "課程開始日期", "課程名稱");
+
+-- /new 依上版日期由新到舊分頁
+CREATE INDEX IF NOT EXISTS 最新訊息_上版日期_idx
+	ON public.最新訊息 (上版日期 DESC, id DESC);
+
+-- 匯入程式以「課程名稱 + 課程開始日期」比對既有課程
+CREATE INDEX IF NOT EXISTS 進修課程_自然鍵_idx
+	ON public."進修課程" ("課程名稱", "課程開始日期");
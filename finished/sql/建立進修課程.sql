@@ -0,0 +1,21 @@
+-- 進修課程資料表，欄位與 114下半年職能進修課程.csv 的標題列相同（全部以文字儲存）
+CREATE TABLE IF NOT EXISTS public."進修課程" (
+	"群組" text NULL,
+	"課程類別" text NULL,
+	"課程名稱" text NULL,
+	"老師" text NULL,
+	"進修人數" text NULL,
+	"報名開始日期" text NULL,
+	"報名結束日期" text NULL,
+	"甄試資訊" text NULL,
+	"進修時數" text NULL,
+	"上課時間" text NULL,
+	"課程開始日期" text NULL,
+	"課程結束日期" text NULL,
+	"不上課日期" text NULL,
+	"課程內容" text NULL,
+	"進修費用" text NULL,
+	"報名資格" text NULL,
+	"就業方向" text NULL,
+	"筆試準備範圍" text NULL
+);
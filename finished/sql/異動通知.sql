@@ -0,0 +1,40 @@
+-- 資料表異動時用 NOTIFY 通知網站各 worker 清除快取（db.on_notify 會 LISTEN 這些頻道）
+-- 匯入課程、手動修改或 TRUNCATE 都會觸發，不需要另外在匯入程式裡送通知
+-- 同時把資料版本加 1，網站用它產生 ETag / Last-Modified 回應 304
+-- UPDATE 只看網站會顯示的欄位：fulltext.py 寫回「搜尋詞」不會改變頁面，不必讓所有快取失效
+-- （產生欄位由這些欄位算出，不必列出；資料表新增要顯示的欄位時記得加進清單）
+
+CREATE TABLE IF NOT EXISTS public.資料版本 (
+	表名 text NOT NULL,
+	版本 bigint NOT NULL DEFAULT 1,
+	更新時間 timestamptz NOT NULL DEFAULT now(),
+	CONSTRAINT 資料版本_pk PRIMARY KEY (表名)
+);
+
+INSERT INTO public.資料版本 (表名) VALUES ('進修課程'), ('最新訊息')
+	ON CONFLICT (表名) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION public.通知資料異動() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	UPDATE public.資料版本
+		SET 版本 = 版本 + 1, 更新時間 = now()
+		WHERE 表名 = TG_TABLE_NAME;
+	PERFORM pg_notify(TG_ARGV[0], TG_OP);
+	RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS 進修課程_異動通知 ON public."進修課程";
+CREATE TRIGGER 進修課程_異動通知
+	AFTER INSERT OR DELETE OR TRUNCATE
+		OR UPDATE OF "群組", "課程類別", "課程名稱", "老師", "進修人數", "報名開始日期", "報名結束日期",
+			"甄試資訊", "進修時數", "上課時間", "課程開始日期", "課程結束日期", "不上課日期",
+			"課程內容", "進修費用", "報名資格", "就業方向", "筆試準備範圍"
+		ON public."進修課程"
+	FOR EACH STATEMENT EXECUTE FUNCTION public.通知資料異動('course_changed');
+
+DROP TRIGGER IF EXISTS 最新訊息_異動通知 ON public.最新訊息;
+CREATE TRIGGER 最新訊息_異動通知
+	AFTER INSERT OR DELETE OR TRUNCATE OR UPDATE OF id, 主題, 上版日期, 內容 ON public.最新訊息
+	FOR EACH STATEMENT EXECUTE FUNCTION public.通知資料異動('news_changed');
@@ -0,0 +1,31 @@
+-- /classes 的課程卡片只用到 7 個顯示欄位，進修課程卻有 18 個文字欄位（課程內容、報名資格、筆試準備範圍都很長）
+-- 把卡片欄位另外存成窄的實體化檢視，依類別排好序號，分頁直接用序號範圍取資料，不必 OFFSET 也不會讀到寬的資料列
+-- 匯入程式 (import_courses.py) 有新增或更新課程時，會在同一個交易裡 REFRESH ... CONCURRENTLY；
+-- 其他方式修改進修課程（手動、管理介面、課程的 SQL 檔）時，網站收到 course_changed 通知後會在幾秒內重新整理
+-- (index.py / course_cards.py)，整理完再把資料版本加 1。網站沒有在執行時請自行執行：
+--   REFRESH MATERIALIZED VIEW CONCURRENTLY public."課程卡片";
+-- 重新整理時網站照常讀取舊的內容。本檔要在 sql/異動通知.sql 之後執行
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public."課程卡片" AS
+SELECT
+	"課程類別",
+	row_number() OVER 類別 AS "序號",
+	count(*) OVER (PARTITION BY "課程類別") AS "類別筆數",
+	"課程名稱",
+	"群組",
+	"進修人數",
+	"進修時數",
+	"進修費用",
+	"上課時間",
+	"課程開始日期"
+FROM public."進修課程"
+WINDOW 類別 AS (PARTITION BY "課程類別" ORDER BY "課程開始日期", "課程名稱")
+ORDER BY "課程類別", "序號";
+
+-- CONCURRENTLY 需要唯一索引；分頁查詢也是用 (課程類別, 序號) 做範圍掃描
+CREATE UNIQUE INDEX IF NOT EXISTS 課程卡片_類別_序號_idx
+	ON public."課程卡片" ("課程類別", "序號");
+
+-- 檢視是依哪一個 進修課程 版本整理的；0 表示下一次異動時一定要重新整理
+INSERT INTO public.資料版本 (表名, 版本) VALUES ('課程卡片', 0)
+	ON CONFLICT (表名) DO NOTHING;
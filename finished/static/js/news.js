@@ -2,6 +2,36 @@
 document.addEventListener('DOMContentLoaded', function () {
     const accordionItems = document.querySelectorAll('.accordion-container .accordion-item');
 
+    // 第一次展開時才向後端載入內容，之後沿用已載入的內容
+    function loadContent(item) {
+        if (item.dataset.loaded === 'true' || !item.dataset.url) return;
+        item.dataset.loaded = 'true';
+        const content = item.querySelector('.accordion-content');
+
+        fetch(item.dataset.url)
+            .then(response => {
+                if (!response.ok) throw new Error(response.status);
+                return response.json();
+            })
+            .then(data => {
+                content.innerHTML = '';
+                const lines = data['內容'] === null ? ['沒有資料'] : data['內容'].split('\n');
+                lines.forEach(line => {
+                    const p = document.createElement('p');
+                    p.textContent = line;
+                    content.appendChild(p);
+                });
+            })
+            .catch(() => {
+                item.dataset.loaded = 'false';
+                content.innerHTML = '<p>載入失敗，請再試一次</p>';
+            });
+    }
+
+    accordionItems.forEach(item => {
+        if (item.classList.contains('is-open')) loadContent(item);
+    });
+
     accordionItems.forEach(item => {
         const header = item.querySelector('.accordion-header');
         if (!header) return;
@@ -27,6 +57,7 @@ document.addEventListener('DOMContentLoaded', function () {
             } else {
                 item.classList.add('is-open');
                 header.setAttribute('aria-expanded', 'true');
+                loadContent(item);
             }
         });
     });
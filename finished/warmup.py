@@ -0,0 +1,71 @@
+# 部署或 worker 重啟後的預熱：在 worker 開始接受請求之前，先做完原本要由第一批請求負擔的工作
+# - 模板全部先編譯好，bytecode 同時存到磁碟 (JINJA_CACHE_DIR)，下次啟動只要讀檔，不必重新編譯
+# - 載入 jieba 詞典（/search 第一次斷詞要一秒左右）
+# - 資料版本、課程類別、每個類別與最新訊息的第一頁先放進 index.data_cache
+# gunicorn.conf.py 會在 master (preload) 或每個 worker 裡呼叫；WARM_UP=0 可以關閉
+import os
+import stat
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+ENABLED = os.getenv('WARM_UP', '1') != '0'
+# 沒有設定時用 Jinja 預設的暫存目錄 (_jinja2-cache-<uid>)，Jinja 會確認目錄屬於目前的使用者而且權限是 0700
+CACHE_DIR = os.getenv('JINJA_CACHE_DIR') or None
+
+
+def private_dir(path):
+    # Jinja 會直接執行目錄裡的 bytecode，別的使用者能寫入的目錄就能注入模板程式碼
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"{path} 必須是目前使用者擁有、權限 0700 的目錄")
+    return path
+
+
+def init_app(app):
+    # bytecode 以模板名稱與原始碼雜湊為 key，模板改版後舊檔不會被誤用
+    try:
+        if CACHE_DIR is None:
+            cache = FileSystemBytecodeCache()
+        else:
+            cache = FileSystemBytecodeCache(private_dir(CACHE_DIR))
+    except (OSError, RuntimeError) as e:
+        # 目錄不安全或無法建立時不存 bytecode，只是啟動時要重新編譯
+        print("模板 bytecode 快取停用")
+        print(e)
+        return
+    app.jinja_env.bytecode_cache = cache
+
+
+def compile_templates(app):
+    names = app.jinja_env.list_templates(extensions=['jinja2'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def load_jieba():
+    import fulltext
+    fulltext.jieba.initialize()
+
+
+def run(log, app, templates=True, data=True, budget=None, heartbeat=None):
+    # 預熱失敗不影響啟動，只是第一批請求會慢一點
+    # budget 是載入資料的秒數上限，超過就停，剩下的交給請求載入；heartbeat 每載入一項呼叫一次
+    if not ENABLED:
+        return
+    start = time.perf_counter()
+    deadline = time.monotonic() + budget if budget is not None else None
+    done = []
+    try:
+        if templates:
+            done.append(f"模板 {compile_templates(app)} 個")
+            load_jieba()
+            done.append("jieba 詞典")
+        if data:
+            import index
+            done.append(f"資料 {index.warm_up(deadline, heartbeat)} 筆")
+    except Exception as e:
+        log.warning("預熱失敗：%s", e)
+    log.info("預熱完成 (%s)，花了 %.2f 秒", "、".join(done) or "無", time.perf_counter() - start)